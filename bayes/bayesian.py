@@ -1,8 +1,6 @@
 from itertools import product
 
-from pgmpy.estimators import MaximumLikelihoodEstimator
-from pgmpy.inference import VariableElimination
-from pgmpy.models import BayesianNetwork
+import numpy as np
 
 
 class Network:
@@ -13,6 +11,9 @@ class Network:
         self.sensor_names = sensor_names
 
     def build(self, result_table):
+        # pgmpy is imported here: it is heavy and it is needed by this backend only
+        from pgmpy.estimators import MaximumLikelihoodEstimator
+        from pgmpy.models import BayesianNetwork
         self.place_consistent = self.detect_place_consistency(result_table)
         self.sensor_faults = self.detect_faulty_sensors(result_table)
         couples = self.get_network_structure()
@@ -42,6 +43,7 @@ class Network:
         # in order to prevent this, it is necessary to implement a faulty sensors detector that check
         # the behaviour of a sensor and penalise it when outputs always the same value (that is not correlated with
         # Place)
+        from pgmpy.inference import VariableElimination
         detection = {}
         ve = VariableElimination(self.model)
         try:
@@ -58,3 +60,81 @@ class Network:
             print(e)
             raise
         return detection
+
+
+class CountingNetwork(Network):
+    """
+    Same analysis of Network, computed from the contingency counts of the detection table. With the naive structure
+    (every sensor is a parent of the asset) the maximum likelihood parameters are frequencies, so the variable
+    elimination reduces to a weighted sum over the 2^n sensor configurations.
+    """
+
+    def __init__(self, sensor_names, crosscheck=False):
+        super().__init__(sensor_names)
+        self.crosscheck = crosscheck
+        self.reference = None
+        self.counts = None
+        self.marginals = None
+
+    def build(self, result_table):
+        self.place_consistent = self.detect_place_consistency(result_table)
+        self.sensor_faults = self.detect_faulty_sensors(result_table)
+        sensors = result_table[self.sensor_names].to_numpy(dtype=bool)
+        asset = result_table['asset'].to_numpy(dtype=bool)
+        codes = sensors @ (1 << np.arange(len(self.sensor_names)))
+        # counts[c, a]: number of samples with sensor configuration c and asset a
+        self.counts = np.bincount(codes * 2 + asset, minlength=2 ** (len(self.sensor_names) + 1)).reshape(-1, 2)
+        self.marginals = sensors.mean(axis=0)
+        if self.crosscheck:
+            self.reference = Network(self.sensor_names)
+            self.reference.build(result_table)
+
+    @staticmethod
+    def posterior(counts, marginals):
+        # P(sensor | asset) of each sensor, given counts[c, a] and the marginal P(sensor) of each sensor
+        n = len(marginals)
+        configurations = ((np.arange(2 ** n)[:, None] >> np.arange(n)) & 1).astype(bool)
+        prior = np.prod(np.where(configurations, marginals, 1 - marginals), axis=1)
+        totals = counts.sum(axis=1)
+        # P(asset | sensors); as in pgmpy, a configuration never observed gets the uniform distribution over the asset
+        # states observed in the table (P(asset) = 1 when the asset is always over its threshold)
+        observed = counts.sum(axis=0) > 0
+        unseen = observed[1] / observed.sum()
+        likelihood = np.where(totals > 0, counts[:, 1] / np.where(totals > 0, totals, 1), unseen)
+        joint = prior * likelihood
+        evidence = joint.sum()
+        if counts[:, 1].sum() == 0 or evidence == 0:
+            e = ValueError('The asset is never over its threshold: P(sensor | asset) is undefined')
+            print(e)
+            raise e
+        return configurations.T @ joint / evidence
+
+    def analysis(self):
+        posterior = CountingNetwork.posterior(self.counts, self.marginals)
+        detection = {}
+        for idx, name in enumerate(self.sensor_names):
+            if name in self.sensor_faults:
+                detection[name] = 0  # Faulty sensor, balanced probability
+            else:
+                detection[name] = float(posterior[idx])
+        if self.crosscheck:
+            self.check(detection, self.reference.analysis())
+        return detection
+
+    @staticmethod
+    def check(detection, reference, tolerance=1e-6):
+        for name in reference:
+            if not np.isclose(detection[name], reference[name], atol=tolerance):
+                print(f'Cross-check failed for {name}: counting {detection[name]}, pgmpy {reference[name]}')
+
+
+class NetworkRegistry:
+    registry = {
+        'pgmpy': Network,
+        'counting': CountingNetwork,
+        'crosscheck': lambda sensor_names: CountingNetwork(sensor_names, crosscheck=True)
+    }
+
+    def getNetwork(kind):
+        return NetworkRegistry.registry[kind]
+
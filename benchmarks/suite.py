@@ -0,0 +1,285 @@
+"""
+Benchmarks of the NED pipeline stages over a matrix of simulation steps, sensors and process kinds. Every stage is
+timed `repeat` times (the minimum and the mean are reported) and run once more under tracemalloc for its peak memory.
+The modules that the stages import on first use are imported before the timings.
+The GSPN output parsing runs on .grg/.sta/.tpd fixtures written at runtime, so GreatSPN is not needed.
+The startup stage imports main in a fresh interpreter: it fails (exit status 1) when it takes longer than
+--startup-budget seconds or when it loads a dependency that only some stages need.
+
+    python -m benchmarks.suite --steps 1000,100000 --sensors 1,3,12 --processes spike,file --output bench.json
+"""
+import argparse
+import importlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from bayes.bayesian import NetworkRegistry
+from domain.factory import ProcessFactoryRegistry
+from domain.geometry import Geometry
+from domain.sensors import Sensor
+from domain.utils import Asset
+from gspn_model.engine import Engine
+from gspn_model.generator import ModelGenerator
+from gspn_model.modelfactory import PlainModelFactory
+from gspn_model.native import NativeEngine, PetriNet
+from main import run_simulation, run_vectorized_simulation, make_global_parameters
+from utils.configuration import Configuration
+
+# dependencies loaded only by the stages that need them
+HEAVY_MODULES = ['matplotlib', 'pandas', 'pgmpy', 'deprecated', 'scipy']
+# modules the stages import on first use: they are imported before the timings, so that the first case of a stage
+# does not pay for them
+WARM_UP_MODULES = ['pandas', 'pgmpy.estimators', 'pgmpy.models', 'pgmpy.inference', 'scipy.sparse',
+                   'scipy.sparse.linalg', 'scipy.stats', 'domain.areaofinterest', 'domain.sidecar']
+
+PROCESSES = {
+    'spike': {'kind': 'spike', 'rate': 0.07, 'range': 70.0, 'mu': 0.0, 'sigma': 0.02, 'level': 100.0},
+    'walk': {'kind': 'walk', 'drift': 0.0, 'mu': 0.0, 'sigma': 1.0, 'level': 112.0},
+    'file': {'kind': 'file', 'column': 'Coincidenze analizzate', 'chunk_size': 65536, 'sidecar': False,
+             'sidecar_folder': None}
+}
+
+
+def measure(setup, stage, repeat, memory=True):
+    # setup builds the input of stage, out of the timings. A failing stage is reported with its error
+    timings = []
+    try:
+        for _ in range(repeat):
+            argument = setup()
+            start = time.perf_counter()
+            stage(argument)
+            timings.append(time.perf_counter() - start)
+    except Exception as e:
+        return {'error': f'{type(e).__name__}: {e}'}
+    retval = {'seconds': min(timings), 'mean_seconds': sum(timings) / len(timings), 'repeat': repeat}
+    if memory:
+        argument = setup()
+        tracemalloc.start()
+        try:
+            stage(argument)
+            retval['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return retval
+
+
+def make_csv(folder, steps, rng):
+    # series in the layout of replication/PREDIS009_process.csv
+    path = f'{folder}/process_{steps}.csv'
+    if not os.path.exists(path):
+        values = 112 + np.cumsum(rng.normal(0, 1, steps))
+        with open(path, 'w') as csv_file:
+            csv_file.write('Tempo,Coincidenze analizzate\n')
+            np.savetxt(csv_file, np.column_stack([np.arange(steps), values]), delimiter=',', fmt=['%d', '%.6f'])
+    return path
+
+
+def make_geometry(process_kind, sensor_number, steps, folder, seed):
+    rng = np.random.default_rng(seed)
+    parameters = dict(PROCESSES[process_kind])
+    if process_kind == 'file':
+        path = make_csv(folder, steps, rng)
+        parameters['filepath'] = os.path.relpath(os.path.dirname(path), os.getcwd()) + '/'
+        parameters['filename'] = os.path.basename(path)
+    process = ProcessFactoryRegistry.getFactory(process_kind).generate(parameters, rng)
+    sensors = []
+    for i in range(sensor_number):
+        angle = 2 * np.pi * i / sensor_number
+        sensors.append(Sensor(f'S{i + 1}', {'position': (3 * np.cos(angle), 3 * np.sin(angle)),
+                                            'threshold': 11.0 + i, 'mu': 0.0, 'sigma': 1.0}))
+    return Geometry(process, sensors, [Asset(4, 0, 7.0)], rng)
+
+
+def gspn_parameters(sensor_number, policy):
+    analysis = {f'S{i + 1}': 0.5 + 0.4 * i / max(sensor_number, 1) for i in range(sensor_number)}
+    config = Configuration()
+    for key, value in [('on_rate', 0.5), ('off_rate', 0.2), ('scheduler', policy)]:
+        config.put(key, value)
+    return make_global_parameters(analysis, 0.1, 0.3, config)
+
+
+def write_fixtures(folder, model_name, net: PetriNet, rng):
+    # GreatSPN steady state outputs of the model: place indices (.grg), throughputs (.sta) and, for every place, the
+    # minimum and maximum number of tokens followed by the probability of each number (.tpd, float64)
+    with open(f'{folder}/{model_name}.grg', 'w') as grg_file:
+        grg_file.write(f'0 {len(net.places)} 1 {len(net.transitions)}\n')
+        for idx, name in enumerate(net.places):
+            grg_file.write(f'{idx + 1} {name} 0 0\n')
+    with open(f'{folder}/{model_name}.sta', 'w') as sta_file:
+        for transition in net.transitions:
+            sta_file.write(f'Thru_{transition.name} = {rng.random()}\n')
+    blocks = []
+    for _ in net.places:
+        probabilities = rng.random(2)
+        blocks.append(np.concatenate([[0.0, 1.0], probabilities / probabilities.sum()]))
+    np.concatenate(blocks).tofile(f'{folder}/{model_name}.tpd')
+
+
+def interpreter_seconds(script, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True).stdout
+        timings.append(time.perf_counter() - start)
+    return min(timings), sum(timings) / len(timings), output.split()
+
+
+def startup_stages(args, folder):
+    # the bare interpreter is timed too, as the budget covers the whole startup
+    interpreter, _, _ = interpreter_seconds('pass', args.repeat)
+    script = f'import sys, main; print(*[m for m in {HEAVY_MODULES!r} if m in sys.modules])'
+    seconds, mean_seconds, loaded = interpreter_seconds(script, args.repeat)
+    yield {'stage': 'startup', 'seconds': seconds, 'mean_seconds': mean_seconds, 'repeat': args.repeat,
+           'interpreter_seconds': interpreter, 'budget': args.startup_budget, 'heavy_modules': loaded,
+           'over_budget': seconds > args.startup_budget or len(loaded) > 0}
+
+
+def warm_up():
+    # a missing optional dependency is reported by the stages that need it
+    for name in WARM_UP_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+
+
+def simulation_stages(args, folder):
+    simulations = {'run_simulation': run_simulation, 'run_vectorized_simulation': run_vectorized_simulation}
+    for process_kind in args.processes:
+        for steps in args.steps:
+            for sensor_number in args.sensors:
+                case = {'process': process_kind, 'steps': steps, 'sensors': sensor_number}
+                for name, simulation in simulations.items():
+                    if name == 'run_simulation' and steps > args.plain_limit:
+                        continue
+
+                    def setup():
+                        return make_geometry(process_kind, sensor_number, steps, folder, args.seed)
+
+                    yield dict(case, stage=name,
+                               **measure(setup, lambda geometry: simulation(geometry, steps), args.repeat,
+                                         args.memory))
+                results = run_vectorized_simulation(make_geometry(process_kind, sensor_number, steps, folder,
+                                                                  args.seed), steps)
+                yield dict(case, stage='get_detection_table',
+                           **measure(lambda: results, lambda r: r.get_detection_table(), args.repeat, args.memory))
+                yield dict(case, stage='get_process_activation_deactivation_rates',
+                           **measure(lambda: results, lambda r: r.get_process_activation_deactivation_rates(),
+                                     args.repeat, args.memory))
+                table = results.get_detection_table()
+                for backend in args.bayes:
+                    if backend == 'pgmpy' and (steps > args.pgmpy_limit or sensor_number > 6):
+                        continue
+                    network_class = NetworkRegistry.getNetwork(backend)
+
+                    def build():
+                        network = network_class(results.get_sensor_names())
+                        network.build(table)
+                        return network
+
+                    yield dict(case, stage=f'Network.build[{backend}]',
+                               **measure(lambda: None, lambda _: build(), args.repeat, args.memory))
+                    yield dict(case, stage=f'Network.analysis[{backend}]',
+                               **measure(build, lambda network: network.analysis(), args.repeat, args.memory))
+
+
+def gspn_stages(args, folder):
+    # the generated models are written in folder, the hand-drawn ones are read from the repository
+    for sensor_number in args.sensors:
+        for policy in ModelGenerator.policies:
+            case = {'sensors': sensor_number, 'policy': policy}
+            parameters = gspn_parameters(sensor_number, policy)
+            repository = 'repository'
+            generator = PlainModelFactory.get_generator(parameters)
+            if generator is not None:
+                repository = os.path.relpath(folder, os.getcwd())
+                generator.write(folder)
+            yield dict(case, stage='PlainModelFactory.instantiate',
+                       **measure(lambda: parameters, PlainModelFactory.instantiate, args.repeat, args.memory))
+            model_name, configuration, measures = PlainModelFactory.instantiate(parameters)
+            net_path = f'{os.getcwd()}/{repository}/{model_name}.net'
+            workspace = tempfile.mkdtemp(dir=folder)
+            write_fixtures(workspace, model_name, PetriNet(net_path), np.random.default_rng(args.seed))
+
+            def engine():
+                return Engine(model_name, repository, configuration, measures, parameters, workspace)
+
+            yield dict(case, stage='Engine.collect',
+                       **measure(engine, lambda e: e.collect(), args.repeat, args.memory))
+            states = ModelGenerator(sensor_number, policy).projected_states()
+            if states <= args.max_states:
+                def load():
+                    NativeEngine.graphs.clear()
+                    return net_path
+
+                yield dict(case, stage='NativeEngine.load', states=states,
+                           **measure(load, NativeEngine.load, args.repeat, args.memory))
+
+                def native():
+                    return NativeEngine(model_name, repository, configuration, measures, parameters)
+
+                yield dict(case, stage='NativeEngine.run', states=states,
+                           **measure(native, lambda e: e.run(), args.repeat, args.memory))
+
+
+def environment():
+    return {'python': platform.python_version(), 'numpy': np.__version__, 'platform': platform.platform(),
+            'cpus': os.cpu_count(), 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z')}
+
+
+def integers(text):
+    return [int(float(value)) for value in text.split(',')]
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(description='NED benchmark suite')
+    parser.add_argument('--steps', type=integers, default=[1000, 10000, 100000])
+    parser.add_argument('--sensors', type=integers, default=[1, 2, 3, 6, 12])
+    parser.add_argument('--processes', type=lambda text: text.split(','), default=['spike', 'walk', 'file'])
+    parser.add_argument('--bayes', type=lambda text: text.split(','), default=['counting', 'pgmpy'])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', dest='memory', action='store_false')
+    parser.add_argument('--plain-limit', type=int, default=100000, help='most steps of run_simulation')
+    parser.add_argument('--pgmpy-limit', type=int, default=100000, help='most steps of the pgmpy backend')
+    parser.add_argument('--max-states', type=int, default=20000, help='largest model solved by NativeEngine')
+    parser.add_argument('--startup-budget', type=float, default=1.0, help='seconds to start the CLI')
+    parser.add_argument('--stages', type=lambda text: text.split(','), default=['startup', 'simulation', 'gspn'])
+    parser.add_argument('--output', default=None, help='JSON file (default: standard output)')
+    return parser.parse_args(argv)
+
+
+def run(args):
+    folder = tempfile.mkdtemp(prefix='ned_bench_', dir=os.getcwd())
+    results = []
+    try:
+        stages = {'startup': startup_stages, 'simulation': simulation_stages, 'gspn': gspn_stages}
+        # the startup stage runs in fresh interpreters, so the imports of warm_up do not affect it
+        warm_up()
+        for name in args.stages:
+            for result in stages[name](args, folder):
+                print(json.dumps(result), file=sys.stderr)
+                results.append(result)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    return {'environment': environment(), 'arguments': vars(args), 'results': results}
+
+
+if __name__ == '__main__':
+    report = run(parse_arguments(sys.argv[1:]))
+    if report['arguments']['output'] is None:
+        print(json.dumps(report, indent=2))
+    else:
+        with open(report['arguments']['output'], 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+    if any(result.get('over_budget', False) for result in report['results']):
+        sys.exit(1)
@@ -0,0 +1,165 @@
+import math
+
+import numpy as np
+
+from bayes.bayesian import CountingNetwork
+from domain.results import run_lengths, ActivationRateException
+
+
+class SequentialStatistics:
+    """
+    Contingency counts and run lengths of a detection series, updated chunk by chunk. The counts give the frequency
+    of each sensor being over its threshold while the asset is; the runs give the mean time the asset spends under
+    (False) and over (True) its threshold. The run still open at the end of the last chunk is not counted.
+    With a forgetting factor lower than 1 a sample (or a closed run) k steps old weighs forgetting^k.
+    """
+
+    def __init__(self, sensor_number, forgetting=1.0):
+        if not 0 < forgetting <= 1:
+            raise ValueError(f'The forgetting factor must be in (0, 1], not {forgetting}')
+        self.forgetting = forgetting
+        self.samples = 0.0
+        self.asset_count = 0.0
+        self.joint_counts = np.zeros(sensor_number)
+        self.current_value = None
+        self.current_length = 0
+        self.run_count = {False: 0.0, True: 0.0}
+        self.run_sum = {False: 0.0, True: 0.0}
+        self.run_sum_squares = {False: 0.0, True: 0.0}
+
+    def weights(self, steps):
+        # decay of the statistics collected so far and weight of each new sample
+        if self.forgetting == 1:
+            return 1.0, np.ones(steps)
+        return self.forgetting ** steps, self.forgetting ** np.arange(steps - 1, -1, -1, dtype=float)
+
+    def __close(self, value, lengths, weights):
+        lengths = np.asarray(lengths, dtype=float)
+        self.run_count[value] += float(np.sum(weights))
+        self.run_sum[value] += float(weights @ lengths)
+        self.run_sum_squares[value] += float(weights @ np.square(lengths))
+
+    def update(self, sensors, asset):
+        # sensors: (steps x sensors) boolean matrix, asset: boolean series of the same steps
+        asset = np.asarray(asset, dtype=bool)
+        values, lengths = run_lengths(asset)
+        if len(values) == 0:
+            return
+        # a closed run weighs as its last sample
+        decay, weights = self.weights(len(asset))
+        run_weights = weights[np.cumsum(lengths[:-1]) - 1]
+        self.samples = self.samples * decay + weights.sum()
+        self.asset_count = self.asset_count * decay + weights[asset].sum()
+        self.joint_counts = self.joint_counts * decay + weights[asset] @ np.asarray(sensors, dtype=bool)[asset]
+        for value in [False, True]:
+            self.run_count[value] *= decay
+            self.run_sum[value] *= decay
+            self.run_sum_squares[value] *= decay
+        if self.current_value is not None:
+            if values[0] == self.current_value:
+                # the first run of the chunk goes on with the open one
+                lengths = lengths.copy()
+                lengths[0] += self.current_length
+            else:
+                # closed just before the chunk
+                self.__close(self.current_value, [self.current_length], np.array([decay]))
+        for value in [False, True]:
+            mask = values[:-1] == value
+            self.__close(value, lengths[:-1][mask], run_weights[mask])
+        self.current_value, self.current_length = bool(values[-1]), int(lengths[-1])
+
+    def detection_probabilities(self):
+        if self.asset_count == 0:
+            return np.zeros_like(self.joint_counts)
+        return self.joint_counts / self.asset_count
+
+    def mean_run_length(self, value):
+        count = self.run_count[value]
+        return self.run_sum[value] / count if count > 0 else math.nan
+
+    def relative_errors(self, confidence=0.95):
+        """
+        Relative half-width of the confidence interval of each estimate: the detection probabilities first, then the
+        mean run lengths under and over the threshold. A probability equal to 0 is judged on the upper bound of its
+        interval, as it has no relative error.
+        """
+        from scipy.stats import norm
+        z = norm.ppf((1 + confidence) / 2)
+        errors = []
+        for p in self.detection_probabilities():
+            if self.asset_count == 0:
+                errors.append(math.inf)
+            elif p > 0:
+                errors.append(z * math.sqrt((1 - p) / (p * self.asset_count)))
+            else:
+                # rule of three
+                errors.append(3 / self.asset_count)
+        for value in [False, True]:
+            count = self.run_count[value]
+            if count < 2:
+                errors.append(math.inf)
+            else:
+                mean = self.run_sum[value] / count
+                variance = max(self.run_sum_squares[value] / count - mean ** 2, 0) * count / (count - 1)
+                errors.append(z * math.sqrt(variance / count) / mean)
+        return errors
+
+    def converged(self, precision, confidence=0.95):
+        return max(self.relative_errors(confidence)) <= precision
+
+
+class OnlineEstimator(SequentialStatistics):
+    """
+    Incremental counterpart of CountingNetwork and of the process rates of Results, for live sensor feeds: samples
+    are given one at a time (add) or in chunks (update) and the state does not grow with them. Besides the run-length
+    accumulators it keeps the counts of each sensor configuration, which the naive Bayesian analysis needs (2^sensors
+    couples of counts, a few for the models in the repository). analysis() and rates() give the same values of the
+    batch analysis of the series seen so far; with forgetting lower than 1 they follow a drifting process.
+    """
+
+    def __init__(self, sensor_names, forgetting=1.0):
+        super().__init__(len(sensor_names), forgetting)
+        self.sensor_names = list(sensor_names)
+        # counts[c, a]: weight of the samples with sensor configuration c and asset a
+        self.counts = np.zeros((2 ** len(self.sensor_names), 2))
+        self.sensor_counts = np.zeros(len(self.sensor_names))
+        # values ever observed for each sensor and for the asset (last row), for the faulty sensors detection
+        self.observed = np.zeros((len(self.sensor_names) + 1, 2), dtype=bool)
+
+    def update(self, sensors, asset):
+        sensors = np.asarray(sensors, dtype=bool).reshape(-1, len(self.sensor_names))
+        asset = np.asarray(asset, dtype=bool)
+        if len(asset) == 0:
+            return
+        decay, weights = self.weights(len(asset))
+        codes = sensors @ (1 << np.arange(len(self.sensor_names)))
+        self.counts = self.counts * decay + np.bincount(codes * 2 + asset, weights=weights,
+                                                        minlength=self.counts.size).reshape(-1, 2)
+        self.sensor_counts = self.sensor_counts * decay + weights @ sensors
+        columns = np.column_stack([sensors, asset])
+        self.observed[:, 1] |= columns.any(axis=0)
+        self.observed[:, 0] |= ~columns.all(axis=0)
+        super().update(sensors, asset)
+
+    def add(self, sensors, asset):
+        # one sample: the detection of each sensor and of the asset
+        self.update([sensors], [asset])
+
+    def analysis(self):
+        if self.samples == 0:
+            raise ValueError('No samples')
+        place_consistent = not self.observed[-1].all()
+        posterior = CountingNetwork.posterior(self.counts, self.sensor_counts / self.samples)
+        detection = {}
+        for idx, name in enumerate(self.sensor_names):
+            if not self.observed[idx].all() and not place_consistent:
+                detection[name] = 0  # Faulty sensor, balanced probability
+            else:
+                detection[name] = float(posterior[idx])
+        return detection
+
+    def rates(self):
+        # activation and deactivation rates, as Results.get_process_activation_deactivation_rates
+        if self.run_count[False] == 0 or self.run_count[True] == 0:
+            raise ActivationRateException(message='Activation or Deactivation rate is 0!!')
+        return self.run_count[False] / self.run_sum[False], self.run_count[True] / self.run_sum[True]
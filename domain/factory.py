@@ -1,4 +1,3 @@
-import csv
 import os
 
 from domain.process import Process, SpikeProcess, RandomWalkProcess, FileProcess
@@ -18,42 +17,59 @@ class ProcessFactory:
 
 class SpikeProcessFactory(ProcessFactory):
     @staticmethod
-    def generate(process_parameters):
+    def generate(process_parameters, rng=None):
         probabilistic, level = ProcessFactory.generate(process_parameters)
         rate = process_parameters['rate']
         range = process_parameters['range']
-        process = SpikeProcess(probabilistic, level, spike_rate=rate, spike_range=np.linspace(0, range))
+        process = SpikeProcess(probabilistic, level, spike_rate=rate, spike_range=np.linspace(0, range),
+                               rng=rng)
         return process
 
 
 class WalkProcessFactory(ProcessFactory):
     @staticmethod
-    def generate(process_parameters):
+    def generate(process_parameters, rng=None):
         probabilistic, level = ProcessFactory.generate(process_parameters)
         drift = process_parameters['drift']
-        process = RandomWalkProcess(probabilistic, level, drift=drift)
+        process = RandomWalkProcess(probabilistic, level, drift=drift, rng=rng)
         return process
 
 
+def read_columns(complete_path, columns, chunk_size, dtypes=None):
+    # parses only the given columns of a CSV file and yields them chunk by chunk as {column: array} dictionaries
+    import pandas as pd
+    reader = pd.read_csv(complete_path, usecols=columns, dtype=dtypes, chunksize=chunk_size)
+    with reader:
+        for chunk in reader:
+            yield {column: chunk[column].to_numpy() for column in columns}
+
+
+def read_column(complete_path, column, chunk_size):
+    for chunk in read_columns(complete_path, [column], chunk_size, {column: np.float64}):
+        yield chunk[column]
+
+
 class FileProcessFactory(ProcessFactory):
     @staticmethod
-    def generate(process_parameters):
+    def generate(process_parameters, rng=None):
         file_path = process_parameters['filepath']
         file_name = process_parameters['filename']
+        column = process_parameters.get('column', 'Coincidenze analizzate')
+        chunk_size = process_parameters.get('chunk_size', 65536)
         complete_path = f'{os.getcwd()}/{file_path}{file_name}'
-
-        with open(complete_path, 'r') as file:
-            reader = csv.reader(file)
-            headers = next(reader, None)
-            column = {}
-            for h in headers:
-                column[h] = []
-            for row in reader:
-                for h, v in zip(headers, row):
-                    if h != 'Data' and h != 'Ora':
-                        v = int(v)
-                    column[h].append(v)
-        return FileProcess(data=column['Coincidenze analizzate'])
+        if not process_parameters.get('sidecar', False):
+            return FileProcess(source=read_column(complete_path, column, chunk_size), rng=rng)
+        from domain.sidecar import SidecarCache
+        cache = SidecarCache(process_parameters.get('sidecar_folder'))
+        series = cache.load(complete_path, column)
+        if series is None:
+            series = np.concatenate(list(read_column(complete_path, column, chunk_size)))
+            try:
+                cache.store(complete_path, column, series)
+                series = cache.load(complete_path, column)
+            except OSError as e:
+                print(e)
+        return FileProcess(data=series, rng=rng)
 
 
 class ProcessFactoryRegistry:
@@ -1,24 +1,30 @@
 import os
 import random
-from typing import List, Union, Optional
+from typing import List, Union, Optional, TYPE_CHECKING
 
-from domain.areaofinterest import AreaOfInterest
 from domain.process import Process
 from domain.sensors import Sensor
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
 
 import numpy as np
 from domain.utils import Place
 
+if TYPE_CHECKING:
+    # the deprecated package is only loaded when an AreaOfInterest is built
+    from domain.areaofinterest import AreaOfInterest
+
 
 class Geometry:
-    def __init__(self, process: Process, sensors: List[Sensor], aoi: AreaOfInterest):
+    def __init__(self, process: Process, sensors: List[Sensor], aoi: 'AreaOfInterest', rng=None):
         self.process = process
         self.sensors = sensors
         self.aoi = aoi
+        # random source of the sensor noise: a np.random.Generator, or the global NumPy random state
+        self.rng = rng if rng is not None else np.random
 
     def draw(self, out_folder: Optional = None):
+        # matplotlib is imported here: it is heavy and it is only needed with --draw
+        import matplotlib.pyplot as plt
+        import matplotlib.patches as patches
         grid_size = 11  # fixed size for draw simplicity
         half_grid = (grid_size - 1) // 2  # This will help place (0,0) in the center
 
@@ -87,6 +93,7 @@ class Geometry:
     @staticmethod
     def generate_random_geometry(processType: Process, num_sensors, num_poi: Union[int, None] = None,
                                  poi: Union[List[Place], None] = None):
+        from domain.areaofinterest import AreaOfInterest
         sensors_place_range = np.linspace(-5, 5)
 
         p: Process = processType
@@ -0,0 +1,81 @@
+import numpy as np
+
+from domain.estimators import OnlineEstimator
+from domain.utils import attenuation
+
+
+class PlacementSearch:
+    """
+    Search of the positions of a set of sensors among candidate places, on one simulated process series.
+    The readings of every sensor at every candidate are computed at once from the attenuation factors, with one noise
+    series for each sensor shared by all its candidates, so the layouts are compared on the same samples. A layout is
+    scored by the probability that at least one of its sensors detects an asset over its threshold, given the
+    detection probabilities of the Bayesian analysis, on the asset where it is the lowest: only the best layouts are
+    left to the GSPN analysis.
+    """
+
+    def __init__(self, process, process_place, candidates, sensors, asset_detection, rng=None):
+        rng = rng if rng is not None else np.random
+        self.candidates = list(candidates)
+        self.sensors = list(sensors)
+        # one column for each asset
+        self.asset_detection = np.asarray(asset_detection, dtype=bool).reshape(len(process), -1)
+        factors = attenuation(process_place, self.candidates)
+        # detections[k]: (steps x candidates) detection matrix of the k-th sensor
+        self.detections = []
+        for sensor in self.sensors:
+            readings = np.multiply.outer(process, factors)
+            readings += sensor.noise(len(process), rng)[:, None]
+            self.detections.append(readings >= sensor.getThreshold())
+        # score of every layout (tuple of candidate indices, one for each of the first sensors) evaluated so far
+        self.scores = dict()
+
+    def analysis(self, layout, idx=0):
+        # detection probabilities of the sensors of layout for the idx-th asset
+        sensors = np.column_stack([self.detections[k][:, c] for k, c in enumerate(layout)])
+        estimator = OnlineEstimator([s.getName() for s in self.sensors[:len(layout)]])
+        estimator.update(sensors, self.asset_detection[:, idx])
+        return estimator.analysis()
+
+    def score(self, layout):
+        layout = tuple(layout)
+        if layout not in self.scores:
+            scores = []
+            for idx in range(self.asset_detection.shape[1]):
+                probabilities = np.array(list(self.analysis(layout, idx).values()), dtype=float)
+                scores.append(1 - np.prod(1 - probabilities))
+            self.scores[layout] = float(min(scores))
+        return self.scores[layout]
+
+    def free(self, layout):
+        return [c for c in range(len(self.candidates)) if c not in layout]
+
+    def greedy(self):
+        # the sensors are placed one at a time, each one where it improves the score the most
+        layout = []
+        for _ in self.sensors:
+            layout.append(max(self.free(layout), key=lambda c: self.score(layout + [c])))
+        return tuple(layout)
+
+    def local_search(self, layout=None, max_iterations=100):
+        # steepest ascent from the greedy layout: a move places one sensor on a free candidate
+        layout = list(layout if layout is not None else self.greedy())
+        for _ in range(max_iterations):
+            best, best_score = None, self.score(layout)
+            for k in range(len(layout)):
+                for c in self.free(layout):
+                    moved = layout[:k] + [c] + layout[k + 1:]
+                    if self.score(moved) > best_score:
+                        best, best_score = moved, self.score(moved)
+            if best is None:
+                break
+            layout = best
+        return tuple(layout)
+
+    def shortlist(self, size):
+        # best complete layouts scored so far
+        complete = [layout for layout in self.scores if len(layout) == len(self.sensors)]
+        return sorted(complete, key=lambda layout: self.scores[layout], reverse=True)[:size]
+
+    def positions(self, layout):
+        return {self.sensors[k].getName(): (self.candidates[c].x, self.candidates[c].y) for k, c in enumerate(layout)}
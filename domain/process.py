@@ -1,5 +1,3 @@
-from random import random, choice
-
 import numpy as np
 
 from domain.utils import Place, ProbabilisticCharacterization
@@ -13,61 +11,123 @@ class NoMoreDataException(Exception):
 
 
 class Process:
-    def __init__(self):
+    def __init__(self, rng=None):
         # the Process is placed at the origin
         self.place: Place = Place(0, 0)
+        # a np.random.Generator, or the global NumPy random state
+        self.rng = rng if rng is not None else np.random
 
     # There are several ways to generate a process, maybe we can return a constant value + a noise
     # or something more complex. It depends on what we want to prove.
     def generate(self):
         pass
 
+    # Batch counterpart of generate: it returns up to n samples as a NumPy array. A chunk shorter than n means that
+    # the process has no more data. Subclasses override it with a vectorized version.
+    def generate_batch(self, n):
+        batch = np.empty(n)
+        for i in range(n):
+            try:
+                batch[i] = self.generate()
+            except NoMoreDataException:
+                return batch[:i]
+        return batch
+
+    def chunks(self, n, chunk_size):
+        remaining = n
+        while remaining > 0:
+            requested = min(chunk_size, remaining)
+            batch = self.generate_batch(requested)
+            if len(batch) > 0:
+                yield batch
+            if len(batch) < requested:
+                break
+            remaining -= requested
+
 
 class RandomWalkProcess(Process):
-    def __init__(self, probabilistic_characterization: ProbabilisticCharacterization, start_val, drift=10):
-        super().__init__()
+    def __init__(self, probabilistic_characterization: ProbabilisticCharacterization, start_val, drift=10, rng=None):
+        super().__init__(rng)
         self.probabilistic_characterization = probabilistic_characterization
         self.val = start_val
         self.drift = drift
 
     def generate(self):
-        self.val = self.val + np.random.normal(self.probabilistic_characterization.mu,
-                                               self.probabilistic_characterization.sigma) + self.drift
+        self.val = self.val + self.rng.normal(self.probabilistic_characterization.mu,
+                                              self.probabilistic_characterization.sigma) + self.drift
         return self.val
 
+    def generate_batch(self, n):
+        steps = self.rng.normal(self.probabilistic_characterization.mu,
+                                self.probabilistic_characterization.sigma, n) + self.drift
+        batch = self.val + np.cumsum(steps)
+        if n > 0:
+            self.val = batch[-1]
+        return batch
+
 
 class SpikeProcess(Process):
     def __init__(self, probabilistic_characterization: ProbabilisticCharacterization, start_val, spike_rate,
-                 spike_range):
-        super().__init__()
+                 spike_range, rng=None):
+        super().__init__(rng)
         self.probabilistic_characterization = probabilistic_characterization
         self.val = start_val
         self.spike_rate = spike_rate
         self.spike_range = spike_range
 
     def generate(self):
-        if random() > self.spike_rate:
-            self.val = self.val + np.random.normal(self.probabilistic_characterization.mu,
-                                                   self.probabilistic_characterization.sigma)
+        if self.rng.random() > self.spike_rate:
+            self.val = self.val + self.rng.normal(self.probabilistic_characterization.mu,
+                                                  self.probabilistic_characterization.sigma)
             return self.val
         else:
-            return self.val + choice(self.spike_range)
+            return self.val + self.rng.choice(self.spike_range)
+
+    def generate_batch(self, n):
+        # a spike does not move the underlying level: the Bernoulli mask zeroes the walk increments where it fires
+        spikes = self.rng.random(n) <= self.spike_rate
+        increments = np.where(spikes, 0, self.rng.normal(self.probabilistic_characterization.mu,
+                                                         self.probabilistic_characterization.sigma, n))
+        levels = self.val + np.cumsum(increments)
+        batch = levels + np.where(spikes, self.rng.choice(self.spike_range, n), 0)
+        if n > 0:
+            self.val = levels[-1]
+        return batch
 
     def __probabilistic_return(self):
-        return choice(self.spike_range) if random() < self.spike_rate else 0
+        return self.rng.choice(self.spike_range) if self.rng.random() < self.spike_rate else 0
 
 
 class FileProcess(Process):
-    def __init__(self, data):
-        super().__init__()
-        self.data = data
-        self.__n = -1
+    def __init__(self, data=None, source=None, rng=None):
+        # data is a series already in memory, source an iterator over its next chunks: they are read only when needed
+        super().__init__(rng)
+        self.data = np.asarray(data, dtype=float) if data is not None else np.empty(0)
+        self.source = source
+        self.__position = 0
+
+    def __fill(self, n):
+        while len(self.data) - self.__position < n and self.source is not None:
+            chunk = next(self.source, None)
+            if chunk is None:
+                self.source = None
+            else:
+                # the samples already consumed are dropped
+                self.data = np.concatenate((self.data[self.__position:], chunk))
+                self.__position = 0
 
     def generate(self):
-        self.__n = self.__n + 1
-        if self.__n < len(self.data):
-            return self.data[self.__n]
-
+        self.__fill(1)
+        if self.__position < len(self.data):
+            value = self.data[self.__position]
+            self.__position = self.__position + 1
+            return value
         else:
             e = NoMoreDataException('No more data')
             raise e
+
+    def generate_batch(self, n):
+        self.__fill(n)
+        batch = self.data[self.__position:self.__position + n]
+        self.__position = self.__position + len(batch)
+        return batch
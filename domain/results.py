@@ -1,5 +1,4 @@
-from matplotlib import pyplot as plt
-import pandas as pd
+import numpy as np
 
 
 class ActivationRateException(Exception):
@@ -9,116 +8,240 @@ class ActivationRateException(Exception):
         self.message = message
 
 
+class InsufficientSamplesException(Exception):
+    def __init__(self, message):
+        # Call the base class constructor with the parameters it needs
+        super().__init__(message)
+        self.message = message
+
+
+def run_lengths(series):
+    # run-length encoding of a boolean series: the value and the length of each run
+    series = np.asarray(series, dtype=bool)
+    if len(series) == 0:
+        return series, np.empty(0, dtype=int)
+    starts = np.concatenate(([0], np.flatnonzero(series[1:] != series[:-1]) + 1))
+    lengths = np.diff(np.append(starts, len(series)))
+    return series[starts], lengths
+
+
+def decimate(series, points):
+    """
+    Indices of the samples drawn for a series of more than points samples: the first and the last sample and, in time
+    order, the minimum and the maximum of each of points / 2 buckets of consecutive samples, so no peak is lost at the
+    output resolution. With points equal to 0 every sample is drawn.
+    """
+    n = len(series)
+    if points <= 0 or n <= points:
+        return np.arange(n)
+    buckets = max(points // 2, 1)
+    width = -(-n // buckets)
+    # the last bucket is padded with the last sample, whose index is clipped back
+    padded = np.pad(np.asarray(series, dtype=float), (0, buckets * width - n), mode='edge').reshape(buckets, width)
+    offsets = np.arange(buckets) * width
+    indices = np.concatenate([[0], offsets + padded.argmin(axis=1), offsets + padded.argmax(axis=1), [n - 1]])
+    return np.unique(np.minimum(indices, n - 1))
+
+
+def decimated(series, points):
+    indices = decimate(series, points)
+    return indices, np.asarray(series)[indices]
+
+
+# figure size of each file drawn by render
+figure_sizes = {'process': (20, 6), 'sensor': (20, 8), 'asset': (20, 6)}
+
+
+def render(figures, output_folder, rasterized=False):
+    """
+    Writes {output_folder}{name}.pdf for each name -> panels entry of figures. A panel is a (title, steps, values,
+    threshold) tuple, drawn in its own subplot; title and threshold may be None. With rasterized the lines are embedded
+    as images, while the axes and the text stay vector.
+    """
+    # matplotlib is imported here: it is heavy and it is only needed with --draw
+    from matplotlib import pyplot as plt
+    for name, panels in figures.items():
+        fig, axs = plt.subplots(len(panels), 1, figsize=figure_sizes[name], squeeze=False)
+        if len(panels) > 1:
+            fig.subplots_adjust(hspace=0.3)
+        for ax, (title, steps, values, threshold) in zip(axs[:, 0], panels):
+            ax.plot(steps, values, rasterized=rasterized)
+            if threshold is not None:
+                ax.axhline(threshold, color='C1')
+            if title is not None:
+                ax.set_title(title)
+            ax.set_xlabel("time (s)")
+            ax.set_ylabel("Count Rate")
+        fig.savefig(output_folder + f"{name}.pdf", format="pdf", bbox_inches="tight",
+                    dpi=200 if rasterized else "figure")
+        plt.close(fig)
+
+
 class Results:
+    # The series are stored column by column in one (steps x (sensors + assets)) float matrix: the sensors come first,
+    # then the assets. The sensors and assets dictionaries are views over its columns.
 
     def __init__(self, pprocess, ssensors, aassets, tthresholds):
-        self.process = pprocess
-        self.sensors = ssensors
-        self.assets = aassets
+        sensor_names = list(ssensors.keys())
+        asset_keys = list(aassets.keys())
+        data = np.empty((len(pprocess), len(sensor_names) + len(asset_keys)))
+        for idx, name in enumerate(sensor_names):
+            data[:, idx] = ssensors[name]
+        for idx, key in enumerate(asset_keys):
+            data[:, len(sensor_names) + idx] = aassets[key]
+        self.init_from_matrix(pprocess, sensor_names, data, tthresholds)
+
+    @classmethod
+    def from_matrix(cls, pprocess, sensor_names, data, tthresholds):
+        results = cls.__new__(cls)
+        results.init_from_matrix(pprocess, sensor_names, data, tthresholds)
+        return results
+
+    @classmethod
+    def concatenate(cls, chunks):
+        # consecutive pieces of the same simulation
+        first = chunks[0]
+        process = np.concatenate([chunk.process for chunk in chunks])
+        data = np.concatenate([chunk.data for chunk in chunks])
+        return cls.from_matrix(process, first.sensor_names, data, first.thresholds)
+
+    def append(self, other):
+        # the steps of other follow the ones already stored
+        if other.sensor_names != self.sensor_names or other.data.shape[1] != self.data.shape[1]:
+            raise ValueError('Only results of the same geometry can be appended')
+        self.process = np.concatenate([self.process, other.process])
+        self.data = np.concatenate([self.data, other.data])
+        return self
+
+    def init_from_matrix(self, pprocess, sensor_names, data, tthresholds):
+        self.process = np.asarray(pprocess, dtype=float)
+        self.sensor_names = list(sensor_names)
+        self.data = data
         self.thresholds = tthresholds
+        # one threshold for each sensor, then one for each asset
+        self.threshold_vector = np.array([tthresholds[name] for name in self.sensor_names] +
+                                         list(tthresholds['assets']), dtype=float)
+
+    @property
+    def sensor_matrix(self):
+        return self.data[:, :len(self.sensor_names)]
+
+    @property
+    def asset_matrix(self):
+        return self.data[:, len(self.sensor_names):]
+
+    @property
+    def sensors(self):
+        return {name: self.data[:, idx] for idx, name in enumerate(self.sensor_names)}
+
+    @property
+    def assets(self):
+        return {idx: column for idx, column in enumerate(self.asset_matrix.T)}
 
     def __len__(self):
-        return len(self.sensors.keys())
+        return len(self.sensor_names)
 
     def number_of_samples(self):
-        sensor_names = list(self.sensors.keys())
-        key = sensor_names[0]
-        data_sample = self.sensors[key]
-        return len(data_sample)
+        return self.data.shape[0]
 
     def get_sensor_names(self):
-        return list(self.sensors.keys())
-
-    def draw_process(self, output_folder):
-        plt.figure(figsize=(20, 6))
-        plt.plot(self.process)
-        # plt.title('process')
-        plt.xlabel("time (s)")
-        plt.ylabel("Count Rate")
-        plt.savefig(output_folder + "process.pdf", format="pdf", bbox_inches="tight")
-
-    def draw_sensors(self, output_folder):
-        num_measures = len(self.sensors.keys())
-        fig, axs = plt.subplots(num_measures, 1, figsize=(20, 8))
-        plt.subplots_adjust(hspace=0.3)
-        i = 0
-        for sensor_name in self.sensors.keys():
-            sensor = self.sensors[sensor_name]
-            thr = self.thresholds[sensor_name]
-            try:
-                axs[i].plot(sensor)
-                axs[i].plot(range(len(sensor)), [thr] * len(sensor))
-                axs[i].set_title(sensor_name)
-                axs[i].set_xlabel("time (s)")
-                axs[i].set_ylabel("Count Rate")
-
-            except Exception as e:
-                axs.plot(sensor)
-                axs.plot(range(len(sensor)), [thr] * len(sensor))
-                axs.set_title(sensor_name)
-                axs.xlabel("time (s)")
-                axs.ylabel("Count Rate")
-            i += 1
-        plt.savefig(output_folder + "sensor.pdf", format="pdf", bbox_inches="tight")
-
-    def draw_asset(self, output_folder):
-        data = self.assets[0]
-        fig, axs = plt.subplots(1, 1, figsize=(20, 6))
-        thr = self.thresholds['asset']
-        axs.plot(data)
-        axs.plot(range(len(data)), [thr] * len(data))
-        # axs.set_title('asset')
-        axs.set_xlabel("time (s)")
-        axs.set_ylabel("Count Rate")
-        plt.savefig(output_folder + "asset.pdf", format="pdf", bbox_inches="tight")
-
-    def draw(self, output_folder):
-        self.draw_process(output_folder)
-        self.draw_sensors(output_folder)
-        self.draw_asset(output_folder)
-
-    # todo: it works just in case of one asset
-    def get_detection_table(self):
-        detection = dict(self.sensors)
-        detection['asset'] = self.assets[0]
-        for key in detection.keys():
-            threshold = self.thresholds[key]
-            detection[key] = list(map(lambda x: x >= threshold, detection[key]))
-        table = pd.DataFrame(detection)
-        return table
-
-    def get_process_rate(self, from_value):
-        table = dict(self.get_detection_table())
-        data = list(table['asset'])
-        indices = range(len(data))
-        merged_list = tuple(zip(indices, data))
-        intervals = []
-        counter = 1
-        while counter < len(data):
-            old = merged_list[counter - 1]
-            new = merged_list[counter]
-            if new[1] != old[1]:
-                intervals.append(counter)
-            counter += 1
-        if data[0] == from_value:
-            intervals.insert(0, 0)
-        if len(intervals) % 2 > 0:
-            intervals = intervals[:-1]
-        counter = 0
-        differences = []
-        while counter < len(intervals):
-            differences.append(intervals[counter + 1] - intervals[counter])
-            counter += 2
-        return float(sum(differences)) / float(len(differences))
-
-    def get_process_activation_deactivation_rates(self):
-        activations = 0
-        deactivations = 0
-        try:
-            activations = 1 / self.get_process_rate(False)
-            deactivations = 1 / self.get_process_rate(True)
-        except Exception as s:
-            print(s)
+        return list(self.sensor_names)
+
+    def process_figure(self, points=0):
+        return [(None, *decimated(self.process, points), None)]
+
+    def sensor_figure(self, points=0):
+        return [(name, *decimated(series, points), self.thresholds[name]) for name, series in self.sensors.items()]
+
+    def asset_figure(self, points=0):
+        titles = [f'asset {idx}' if len(self.assets) > 1 else None for idx in self.assets]
+        return [(title, *decimated(series, points), self.thresholds['assets'][idx])
+                for title, (idx, series) in zip(titles, self.assets.items())]
+
+    def figures(self, points=0):
+        # what render draws: the series are decimated here, so they are small enough to be sent to another process
+        return {'process': self.process_figure(points), 'sensor': self.sensor_figure(points),
+                'asset': self.asset_figure(points)}
+
+    def draw_process(self, output_folder, points=0, rasterized=False):
+        render({'process': self.process_figure(points)}, output_folder, rasterized)
+
+    def draw_sensors(self, output_folder, points=0, rasterized=False):
+        render({'sensor': self.sensor_figure(points)}, output_folder, rasterized)
+
+    def draw_asset(self, output_folder, points=0, rasterized=False):
+        render({'asset': self.asset_figure(points)}, output_folder, rasterized)
+
+    def draw(self, output_folder, points=0, rasterized=False):
+        render(self.figures(points), output_folder, rasterized)
+
+    def get_detection_matrix(self):
+        return self.data >= self.threshold_vector
+
+    def get_detection_table(self, idx=0):
+        # the sensors and the asset idx
+        return self.get_detection_tables()[idx]
+
+    def get_detection_tables(self):
+        # one table for each asset, from the same detection matrix: the sensor columns of every table are a view of
+        # its sensor block, only the asset column is copied into each table
+        import pandas as pd
+        detection = self.get_detection_matrix()
+        sensor_number = len(self.sensor_names)
+        tables = []
+        for column in range(sensor_number, detection.shape[1]):
+            table = pd.DataFrame(detection[:, :sensor_number], columns=self.sensor_names, copy=False)
+            table['asset'] = detection[:, column]
+            tables.append(table)
+        return tables
+
+    def get_asset_detection(self, idx=0):
+        column = len(self.sensor_names) + idx
+        return self.data[:, column] >= self.threshold_vector[column]
+
+    def get_asset_detection_matrix(self):
+        return self.get_detection_matrix()[:, len(self.sensor_names):]
+
+    def get_process_run_lengths(self, idx=0):
+        # lengths of the runs where the asset is over (True) or under (False) its threshold.
+        # The last run is cut by the end of the simulation, so it is not taken into account
+        values, lengths = run_lengths(self.get_asset_detection(idx))
+        values, lengths = values[:-1], lengths[:-1]
+        return {False: lengths[~values], True: lengths[values]}
+
+    def get_run_counts(self):
+        """
+        Number of the runs under (False) and over (True) the threshold, and number of steps they cover, for all the
+        assets at once. As in get_process_run_lengths, the last run of each asset is not taken into account.
+        """
+        detection = self.get_asset_detection_matrix()
+        steps, asset_number = detection.shape
+        runs = {False: np.zeros(asset_number, dtype=int), True: np.zeros(asset_number, dtype=int)}
+        lengths = {False: np.zeros(asset_number, dtype=int), True: np.zeros(asset_number, dtype=int)}
+        if steps == 0:
+            return runs, lengths
+        starts = np.ones(detection.shape, dtype=bool)
+        starts[1:] = detection[1:] != detection[:-1]
+        last_start = steps - 1 - np.argmax(starts[::-1], axis=0)
+        completed = np.arange(steps)[:, None] < last_start
+        for value in [False, True]:
+            selected = completed & (detection == value)
+            runs[value] = (selected & starts).sum(axis=0)
+            lengths[value] = selected.sum(axis=0)
+        return runs, lengths
+
+    def get_asset_samples(self, idx=0):
+        return int(self.get_asset_detection(idx).sum())
+
+    def get_activation_deactivation_rates(self):
+        # activation and deactivation rate of every asset: NaN where there is no run to estimate it
+        runs, lengths = self.get_run_counts()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return runs[False] / lengths[False], runs[True] / lengths[True]
+
+    def get_process_activation_deactivation_rates(self, idx=0):
+        activations, deactivations = self.get_activation_deactivation_rates()
+        if np.isnan(activations[idx]) or np.isnan(deactivations[idx]):
             e = ActivationRateException(message='Activation or Deactivation rate is 0!!')
             raise e
-        return activations, deactivations
+        return float(activations[idx]), float(deactivations[idx])
@@ -1,5 +1,7 @@
 from typing import Union
 
+import numpy as np
+
 from domain.utils import Place, ProbabilisticCharacterization
 
 
@@ -26,3 +28,7 @@ class Sensor:
 
     def getThreshold(self):
         return self.threshold
+
+    def noise(self, size=None, rng=None):
+        rng = rng if rng is not None else np.random
+        return rng.normal(self.probabilistic_characterization.mu, self.probabilistic_characterization.sigma, size)
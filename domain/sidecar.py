@@ -0,0 +1,51 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from utils.utils import atomic_write
+
+
+class SidecarCache:
+    """
+    Parsed process series saved as .npy files beside their source (or in folder, if given). The file name depends on
+    the source path and the column; the size and the modification time of the source are saved with the series, so a
+    changed source is parsed again. The series are loaded memory-mapped and read-only, so several processes share them.
+    """
+
+    def __init__(self, folder=None):
+        self.folder = folder
+
+    def paths(self, complete_path, column):
+        source = os.path.abspath(complete_path)
+        folder = self.folder if self.folder is not None else os.path.dirname(source)
+        digest = hashlib.sha1(f'{source}:{column}'.encode('utf-8')).hexdigest()[:16]
+        base = f'{folder}/.{os.path.basename(source)}.{digest}.ned'
+        return f'{base}.npy', f'{base}.json'
+
+    @staticmethod
+    def signature(complete_path, column):
+        stat = os.stat(complete_path)
+        return {'source': os.path.abspath(complete_path), 'column': column, 'size': stat.st_size,
+                'mtime': stat.st_mtime_ns}
+
+    def load(self, complete_path, column):
+        series_path, signature_path = self.paths(complete_path, column)
+        try:
+            with open(signature_path, 'r') as signature_file:
+                signature = json.load(signature_file)
+            if signature != SidecarCache.signature(complete_path, column):
+                return None
+            return np.load(series_path, mmap_mode='r')
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def store(self, complete_path, column, series):
+        series_path, signature_path = self.paths(complete_path, column)
+        folder = os.path.dirname(series_path)
+        os.makedirs(folder, exist_ok=True)
+        with atomic_write(series_path, 'wb') as series_file:
+            np.save(series_file, series)
+        with atomic_write(signature_path) as signature_file:
+            json.dump(SidecarCache.signature(complete_path, column), signature_file)
@@ -1,4 +1,4 @@
-from typing import Union
+from typing import Union, List
 
 import numpy as np
 
@@ -30,11 +30,17 @@ class ProbabilisticCharacterization:
 
 
 def transport_formula(p_val, probabilistic_characterization: Union[ProbabilisticCharacterization, None], p_place: Place,
-                      v_place: Place):
+                      v_place: Place, rng=None):
     val = p_val / ((p_place.x - v_place.x) ** 2 + (p_place.y - v_place.y) ** 2)
     if probabilistic_characterization is not None:
-        e = np.random.normal(probabilistic_characterization.mu, probabilistic_characterization.sigma)
+        rng = rng if rng is not None else np.random
+        e = rng.normal(probabilistic_characterization.mu, probabilistic_characterization.sigma)
         val = val + e
     return val
 
 
+def attenuation(p_place: Place, v_places: List[Place]):
+    # vectorized counterpart of the deterministic part of transport_formula: one factor for each place
+    distances = np.array([(p_place.x - v.x) ** 2 + (p_place.y - v.y) ** 2 for v in v_places], dtype=float)
+    return 1 / distances
+
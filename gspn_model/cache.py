@@ -0,0 +1,77 @@
+import glob
+import hashlib
+import json
+import os
+
+from utils.utils import atomic_write
+
+
+class AnalysisCache:
+    """
+    On-disk cache of the measures computed by an Engine. An entry is keyed by the engine kind, the model name, the
+    contents of its .net/.def files and the canonical -rpar parameter list; it stores the throughputs and the mean
+    token counts. The cache keeps at most max_entries entries, evicting the least recently used ones.
+    """
+
+    opened = dict()
+
+    def __init__(self, folder, max_entries=1000):
+        self.folder = folder
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(folder, exist_ok=True)
+
+    @staticmethod
+    def open(folder, max_entries=1000):
+        # one instance for each folder, so the counters cover all the engines of the process
+        if folder not in AnalysisCache.opened:
+            AnalysisCache.opened[folder] = AnalysisCache(folder, max_entries)
+        return AnalysisCache.opened[folder]
+
+    @staticmethod
+    def canonical(parameter_list):
+        # the list is made of ('-rpar', name, value) triples: they are sorted by name and the values become floats
+        triples = [(parameter_list[i + 1], float(parameter_list[i + 2])) for i in range(0, len(parameter_list), 3)]
+        return ';'.join(f'{name}={value!r}' for name, value in sorted(triples))
+
+    def key(self, engine):
+        digest = hashlib.sha256()
+        digest.update(type(engine).__name__.encode('utf-8'))
+        digest.update(engine.model.encode('utf-8'))
+        for extension in ['net', 'def']:
+            with open(f'{os.getcwd()}/{engine.model_repo}/{engine.model}.{extension}', 'rb') as model_file:
+                digest.update(model_file.read())
+        digest.update(AnalysisCache.canonical(engine.getParamList()).encode('utf-8'))
+        return digest.hexdigest()
+
+    def get(self, key):
+        path = f'{self.folder}/{key}.json'
+        try:
+            with open(path, 'r') as entry:
+                values = json.load(entry)
+            # the modification time is the last use of the entry
+            os.utime(path)
+            self.hits += 1
+            return values
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.misses += 1
+            return None
+
+    def put(self, key, values):
+        with atomic_write(f'{self.folder}/{key}.json') as entry:
+            json.dump(values, entry)
+        self.evict()
+
+    def evict(self):
+        entries = glob.glob(f'{self.folder}/*.json')
+        if len(entries) > self.max_entries:
+            entries.sort(key=lambda path: os.path.getmtime(path))
+            for path in entries[:len(entries) - self.max_entries]:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
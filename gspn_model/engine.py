@@ -1,20 +1,30 @@
 import os
 
-from gspn_model.gspn_naive_handle import GSPN_handler
-from utils.configuration import Configuration
-import ctypes
+from gspn_model.gspn_naive_handle import GSPN_handler, GSPNException
+from gspn_model.outputs import AnalysisOutputs
+from utils.tracing import span
 
 
 class Engine:
-    def __init__(self, model, model_repo, configuration, measures, gspn_parameters=None):
+    def __init__(self, model, model_repo, configuration, measures, gspn_parameters=None, workspace=None, cache=None,
+                 greatspn=None):
         self.model = model
         self.model_configuration = configuration
         self.model_repo = model_repo
         self.measures = measures
-        config = Configuration()
-        self.gspn_bin_path = config.get('greatspn')  # todo: use the parameter and make run general
+        # the analysis runs in the workspace folder, if given, otherwise in the shared {model}_analysis folder
+        self.workspace = workspace
+        self.analysis_path = workspace if workspace is not None else \
+            f'{os.getcwd()}/{model_repo}/{model}_analysis'
+        self.cache = cache
+        self.cache_key = None
+        self.measure_values = None
+        self.outputs = None
+        # greatspn is the folder of the GreatSPN binaries: None uses the default one of GSPN_handler
         self.gspn_parameters = gspn_parameters
-        self.gspn_handler: GSPN_handler = GSPN_handler(greatspn_scripts=self.gspn_bin_path)
+        self.gspn_handler: GSPN_handler = GSPN_handler(greatspn_scripts=greatspn) if greatspn is not None \
+            else GSPN_handler()
+        self.gspn_bin_path = self.gspn_handler.greatspn_scripts
 
     def getParamList(self):
         retval = list()
@@ -22,63 +32,89 @@ class Engine:
             retval.extend(['-rpar', key, str(self.model_configuration[key])])
         return retval
 
+    def cached(self):
+        # True when the measures of the current configuration are in the cache, and loaded
+        if self.cache is None:
+            return False
+        self.cache_key = self.cache.key(self)
+        self.measure_values = self.cache.get(self.cache_key)
+        return self.measure_values is not None
+
+    def store(self):
+        # measures of the last run, saved in the cache
+        self.measure_values = self.collect()
+        if self.cache is not None:
+            self.cache.put(self.cache_key, self.measure_values)
+
+    def job(self):
+        # what an AsyncGSPNRunner needs to run the analysis of the current configuration
+        return self.model, self.model_repo, self.getParamList(), self.analysis_path
+
     def execute(self):
-        self.gspn_handler.generic_analysis(self.model, self.model_repo, self.getParamList())
+        with span('Engine.execute', 'gspn', engine=type(self).__name__, model=self.model) as args:
+            args['cache_hit'] = self.cached()
+            if args['cache_hit']:
+                return
+            with span('Engine.run', 'gspn'):
+                self.run()
+            self.store()
+
+    def sweep(self, configurations):
+        # one (safety, sustainability) couple for each model configuration
+        results = []
+        for configuration in configurations:
+            self.model_configuration = configuration
+            self.execute()
+            results.append((self.safety(), self.sustainability()))
+        return results
+
+    def run(self):
+        self.outputs = None
+        self.gspn_handler.generic_analysis(self.model, self.model_repo, self.getParamList(), self.workspace)
+
+    def collect(self):
+        # a missing output file is an error, so the measures of a failed analysis are never cached
+        values = {
+            'throughputs': {name: self.lookup(self.get_throughput, name) for name in self.measures['safety']},
+            'tokens': {name: self.lookup(self.get_mean_tokens, name) for name in self.measures['sustainability']}
+        }
+        missing = [name for measures in values.values() for name, value in measures.items() if value is None]
+        if len(missing) > 0:
+            raise GSPNException(f'No value of {", ".join(missing)} in the outputs of {self.model} in '
+                                f'{self.analysis_path}')
+        return values
+
+    @staticmethod
+    def lookup(getter, name):
+        with span(f'Engine.{getter.__name__}', 'gspn', node=name):
+            return getter(name)
 
     def safety(self) -> float:
         transition_names = self.measures['safety']
-        values = list(map(self.get_throughput, transition_names))
+        values = list(map(lambda name: self.measure_values['throughputs'][name], transition_names))
         retval = 1 / sum(values)
         return retval
 
     def sustainability(self) -> float:
         place_names = self.measures['sustainability']
-        values = list(map(self.__c_readtpd_wrapper, place_names))
+        values = list(map(lambda name: self.measure_values['tokens'][name], place_names))
         values = list(map(lambda x: 1 / x, values))
         retval = min(values)
         return retval
 
-    def __c_readtpd_wrapper(self, node_name) -> float:
-        c_library = ctypes.CDLL(f'{os.getcwd()}/gspn_model/readtpd.so')
-        get_average_wrapper = c_library.get_average
-        get_average_wrapper.argtypes = [ctypes.c_char_p, ctypes.c_int]
-        get_average_wrapper.restype = ctypes.c_float
-        netpath = f'{os.getcwd()}/{self.model_repo}/{self.model}_analysis'
-        trovato: bool = False
-        node_id = -1
+    def get_outputs(self) -> AnalysisOutputs:
+        if self.outputs is None:
+            self.outputs = AnalysisOutputs(self.analysis_path, self.model)
+        return self.outputs
+
+    def get_mean_tokens(self, node_name) -> float:
         try:
-            with open(f'{netpath}/{self.model}.grg', 'r') as grg_file:
-                for line in grg_file:
-                    if node_name in line:
-                        node_id = int(line[0])
-                        trovato = True
-                        break
-            if trovato:
-                netname = f'{netpath}/{self.model}'
-                netname_bytes = netname.encode('utf-8')
-                avg = get_average_wrapper(netname_bytes, node_id)
-                return avg
-            else:
-                raise Exception("Node not found")
+            return self.get_outputs().mean_tokens(node_name)
         except FileNotFoundError:
             print("File not found")
 
     def get_throughput(self, transition_name: str) -> float:
-        line_header = 'Thru_' + transition_name
-        netpath = f'{os.getcwd()}/{self.model_repo}/{self.model}_analysis'
-        trovato: bool = False
-        retval = None
         try:
-            with open(f'{netpath}/{self.model}.sta', 'r') as grg_file:
-                while (not trovato):
-                    line = grg_file.__next__()
-                    if line_header in line:
-                        elements = line.split(' ')
-                        retval = float(elements[2])
-                        trovato = True
-            if trovato is False:
-                print(f'Error {transition_name}')
-                raise Exception('Thru not found')
+            return self.get_outputs().throughput(transition_name)
         except FileNotFoundError:
             print("File not found")
-        return retval
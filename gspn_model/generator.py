@@ -0,0 +1,154 @@
+import os
+
+from utils.utils import atomic_write
+
+
+class ModelGenerator:
+    """
+    GSPN model of N sensors, written in the GreatSPN .net/.def format, with the -rpar parameter bindings and the
+    measures used by the Engine. Every sensor has the sensing/used sub-net of the hand-drawn models (transitions able,
+    unable, switch_on, switch_off, flushing); the scheduling policy decides how the sensors are switched on:
+    - independent: every sensor has its own idle/active cycle;
+    - interleaved: one sensor at a time is active, they race for the shared idle token;
+    - most_effective: as interleaved, but the next sensor is chosen with probability proportional to its detection
+      probability.
+    All the names of the sensor nodes end with _i, with i from 1 to N.
+    """
+
+    policies = ['independent', 'interleaved', 'most_effective']
+
+    def __init__(self, sensor_number, policy='independent'):
+        if sensor_number < 1:
+            raise ValueError('At least one sensor is needed')
+        if policy not in ModelGenerator.policies:
+            raise ValueError(f'Unknown scheduling policy {policy}')
+        self.sensor_number = sensor_number
+        self.policy = policy
+        self.places = []
+        self.rates = []
+        self.transitions = []
+        self.build()
+
+    def model_name(self):
+        return f'generated_{self.policy}_{self.sensor_number}'
+
+    def sensors(self):
+        return range(1, self.sensor_number + 1)
+
+    def place(self, name, marking=0):
+        self.places.append((name, marking))
+
+    def rate(self, name):
+        self.rates.append(name)
+        # a negative rate refers to the (1-based) index of the rate parameter
+        return -len(self.rates)
+
+    def transition(self, name, rate, immediate, inputs, outputs, inhibitors=()):
+        self.transitions.append((name, rate, immediate, list(inputs), list(outputs), list(inhibitors)))
+
+    def build(self):
+        shared_idle = self.policy != 'independent'
+        self.place('no_event', 1)
+        self.place('hazard')
+        if shared_idle:
+            self.place('idle', 1)
+        self.transition('activation', self.rate('EventStartRate'), False, ['no_event'], ['hazard'])
+        self.transition('deactivation', self.rate('EventEndRate'), False, ['hazard'], ['no_event'])
+        for i in self.sensors():
+            for name in ['sensing', 'on_command', 'off_command', 'used', 'active']:
+                self.place(f'{name}_{i}')
+            idle = 'idle' if self.policy == 'interleaved' else f'idle_{i}'
+            if self.policy != 'interleaved':
+                self.place(idle, 0 if shared_idle else 1)
+            back = 'idle' if shared_idle else idle
+            self.transition(f'on_{i}', self.rate(f'InRate_{i}'), False, [idle], [f'active_{i}', f'on_command_{i}'])
+            self.transition(f'off_{i}', self.rate(f'OffRate_{i}'), False, [f'active_{i}'],
+                            [back, f'off_command_{i}'])
+            detection = self.rate(f'DetectionProb_{i}')
+            self.transition(f'able_{i}', detection, True, [f'sensing_{i}', 'hazard'],
+                            [f'sensing_{i}', 'no_event'], [f'used_{i}'])
+            self.transition(f'unable_{i}', self.rate(f'UnDetectionProb_{i}'), True, [f'sensing_{i}', 'hazard'],
+                            [f'sensing_{i}', 'hazard', f'used_{i}'], [f'used_{i}'])
+            self.transition(f'switch_on_{i}', 1.0, True, [f'on_command_{i}'], [f'sensing_{i}'])
+            self.transition(f'switch_off_{i}', 1.0, True, [f'sensing_{i}', f'off_command_{i}'], [])
+            self.transition(f'flushing_{i}', 1.0, True, [f'used_{i}'], [], [f'sensing_{i}'])
+            if self.policy == 'most_effective':
+                self.transition(f'scheduling_{i}', detection, True, ['idle'], [idle])
+
+    def net(self):
+        index = {name: idx + 1 for idx, (name, _) in enumerate(self.places)}
+
+        def arcs(places):
+            # multiplicity, place, number of intermediate points, layer
+            return [f'   1 {index[name]} 0 0' for name in places]
+
+        lines = ['|0|', '|', f'f 0 {len(self.places)} {len(self.rates)} {len(self.transitions)} 1 0 0']
+        for idx, (name, marking) in enumerate(self.places):
+            x, y = 1.0 + 2.0 * (idx % 8), 1.0 + 1.5 * (idx // 8)
+            lines.append(f'{name} {marking} {x} {y} {x} {y + 0.3} 0')
+        for idx, name in enumerate(self.rates):
+            lines.append(f'{name} -7134.0 {18.0} {1.0 + 0.4 * idx} 0')
+        lines.append('G1 0.0 0.0 1')
+        for idx, (name, rate, immediate, inputs, outputs, inhibitors) in enumerate(self.transitions):
+            x, y = 2.0 + 2.0 * (idx % 8), 1.75 + 1.5 * (idx // 8)
+            # rate, servers (0 is infinite server), kind (0 is exponential, otherwise the priority group),
+            # number of input arcs, rotation, then the coordinates of the transition, its name and its rate
+            servers, kind = (1, 1) if immediate else (0, 0)
+            lines.append(f'{name} {rate} {servers} {kind} {len(inputs)} 0 {x} {y} {x} {y + 0.3} {x} {y - 0.3} 0')
+            lines.extend(arcs(inputs))
+            lines.append(f'   {len(outputs)}')
+            lines.extend(arcs(outputs))
+            lines.append(f'   {len(inhibitors)}')
+            lines.extend(arcs(inhibitors))
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def definitions():
+        return '|256\n%\n|\n'
+
+    def bindings(self):
+        # -rpar value of each rate parameter, from the global parameters built by the simulation
+        retval = {
+            'EventStartRate': lambda conf: conf['process']['activation_rate'],
+            'EventEndRate': lambda conf: conf['process']['deactivation_rate']
+        }
+        for i in self.sensors():
+            retval[f'InRate_{i}'] = lambda conf: conf['scheduler']['on_rate']
+            retval[f'OffRate_{i}'] = lambda conf: conf['scheduler']['off_rate']
+            retval[f'DetectionProb_{i}'] = \
+                lambda conf, idx=i - 1: list(conf['sensors'].values())[idx]['detection_probability']
+            retval[f'UnDetectionProb_{i}'] = \
+                lambda conf, idx=i - 1: 1 - list(conf['sensors'].values())[idx]['detection_probability']
+        return retval
+
+    def measures(self):
+        return {
+            'safety': ['deactivation'] + [f'able_{i}' for i in self.sensors()],
+            'sustainability': [f'sensing_{i}' for i in self.sensors()]
+        }
+
+    def projected_states(self):
+        """
+        Number of tangible markings of the model. When the hazard is off a sensor is idle, active or active with the
+        used flag set; while the hazard is on an active sensor that has not been used is vanishing (able or unable
+        fire at once).
+        """
+        n = self.sensor_number
+        if self.policy == 'independent':
+            return 3 ** n + 2 ** n
+        if self.policy == 'interleaved':
+            return 3 * n + 2
+        return 5 * n
+
+    def write(self, folder):
+        # the files are rewritten only when they change, so the engines keep their cached state spaces
+        os.makedirs(folder, exist_ok=True)
+        for extension, content in [('net', self.net()), ('def', ModelGenerator.definitions())]:
+            path = f'{folder}/{self.model_name()}.{extension}'
+            if os.path.exists(path):
+                with open(path, 'r') as model_file:
+                    if model_file.read() == content:
+                        continue
+            with atomic_write(path) as model_file:
+                model_file.write(content)
+        return self.model_name()
@@ -1,3 +1,4 @@
+import asyncio
 import glob
 import os
 import subprocess
@@ -5,15 +6,16 @@ from enum import Enum
 import copy
 from typing import Union
 import numpy as np
-from utils.metaclasses import Singleton
 import shutil
 
+from utils.tracing import span, lane
 from utils.utils import clear_folder
 
 
 class OpType(Enum):
     gspn = 'GSPN'
     cmd = 'CMD'
+    file = 'FILE'
 
 
 class Operation:
@@ -23,26 +25,72 @@ class Operation:
         self.parameters = parameters
 
 
-class GSPN_handler(metaclass=Singleton):
+class GSPNException(Exception):
+    def __init__(self, message):
+        # Call the base class constructor with the parameters it needs
+        super().__init__(message)
+        self.message = message
+
+
+def truncate(path):
+    open(path, 'w').close()
+
+
+# operations of type file, run in-process
+file_operations = {
+    'truncate': truncate,
+    'copy': shutil.copyfile
+}
+
+
+def run_file_operation(operation: Operation):
+    with span(operation.name, 'gspn', arguments=operation.parameters):
+        file_operations[operation.name](*operation.parameters)
+
+
+def operation_command(greatspn_scripts, model_name, operation: Operation):
+    # command line of an operation of type gspn or cmd
+    if operation.type == OpType.gspn:
+        return [f"{greatspn_scripts}/{operation.name}"] + [model_name] + operation.parameters
+    return operation.name
+
+
+def log_tail(path, lines=20):
+    with open(path, 'r', errors='replace') as log_file:
+        return ''.join(log_file.readlines()[-lines:])
+
+
+def check_exit_code(command, exit_code, model_name, log_file):
+    # a tool exiting with a non-zero code fails the analysis, quoting the end of its log
+    if exit_code != 0:
+        log_file.flush()
+        raise GSPNException(f"{command[0]} exited with code {exit_code} on {model_name}:\n"
+                            f"{log_tail(log_file.name)}")
+
+
+class GSPN_handler:
     def __init__(self, greatspn_scripts: Union[str, None] = "/opt/greatspn/lib/app/portable_greatspn/bin/"):
         self.greatspn_scripts = greatspn_scripts
 
-    def __run_greatspn(self, model_name, procedure, params):
+    def __run_greatspn(self, model_name, operation: Operation, log_file):
         """
-        Function to run any GREATSPN procedure with customizable parameters.
+        Function to run any GREATSPN procedure (or command) with customizable parameters.
 
         :param model_name: Name of the model (e.g., 'Shared').
-        :param procedure: Name of the GREATSPN procedure to execute (e.g., 'WNRG', 'swn_stndrd').
-        :param params: List of parameters for the procedure (each parameter and its value as separate items in the list).
-        :param greatspn_scripts: Path to the directory containing GREATSPN binaries.
+        :param operation: Operation of type gspn (procedure name and its parameters, e.g. 'WNRG') or cmd.
+        :param log_file: Open file receiving the command line and the output of the procedure.
         """
         # Build the full command
-        command = [f"{self.greatspn_scripts}/{procedure}"] + [model_name] + params
-        print(f"Executing: {' '.join(command)}")  # For debugging purposes
+        command = operation_command(self.greatspn_scripts, model_name, operation)
+        log_file.write(f"Executing: {' '.join(command)}\n")
+        log_file.flush()
         # Run the command
-        subprocess.run(command)
+        with span(os.path.basename(command[0]), 'gspn') as args:
+            args['exit_code'] = subprocess.run(command, stdout=log_file, stderr=subprocess.STDOUT).returncode
+        check_exit_code(command, args['exit_code'], model_name, log_file)
 
-    def run_steady_state_analysis(self, model_name, parameters):
+    @staticmethod
+    def steady_state_operations(model_name, parameters):
         extended_pars = copy.deepcopy(parameters)
         extended_pars.extend([
             '-m',
@@ -53,25 +101,29 @@ class GSPN_handler(metaclass=Singleton):
             Operation(op_type=OpType.gspn, name='WNRG',
                       parameters=extended_pars),
             # Clear .gst file
-            Operation(op_type=OpType.cmd, name=["cp", "/dev/null", f"{model_name}.gst"]),
+            Operation(op_type=OpType.file, name='truncate', parameters=[f"{model_name}.gst"]),
             # Call swn_stndrd
             Operation(op_type=OpType.gspn, name='swn_stndrd', parameters=[]),
             # Call swn_ggsc with its parameters
             Operation(op_type=OpType.gspn, name='swn_ggsc', parameters=['-e1.0E-7', '-i10000']),
             # Copy .epd to .mpd
-            Operation(op_type=OpType.cmd, name=["cp", f"{model_name}.epd", f"{model_name}.mpd"]),
+            Operation(op_type=OpType.file, name='copy', parameters=[f"{model_name}.epd", f"{model_name}.mpd"]),
             # Call swn_gst_prep with different parameters
             Operation(op_type=OpType.gspn, name='swn_gst_prep',
                       parameters=parameters),
             # Call swn_gst_stndrd
             Operation(op_type=OpType.gspn, name='swn_gst_stndrd', parameters=['-append', f"{model_name}.sta"])
         ]
-        for op in operations:
-            if op.type == OpType.gspn:
-                self.__run_greatspn(model_name, op.name,
-                                    op.parameters)
-            else:
-                subprocess.run(op.name)
+        return operations
+
+    def run_steady_state_analysis(self, model_name, parameters):
+        # the output of the tools goes to {model_name}.log; a tool exiting with a non-zero code raises a GSPNException
+        with open(f'{model_name}.log', 'w') as log_file:
+            for op in GSPN_handler.steady_state_operations(model_name, parameters):
+                if op.type == OpType.file:
+                    run_file_operation(op)
+                else:
+                    self.__run_greatspn(model_name, op, log_file)
 
     # @TODO: find a way to use the gspn_modelfactory
     def one_sensor_analysis(self, detection_prob, event_end_rate, event_start_rate, on_rate, off_rate):
@@ -96,10 +148,12 @@ class GSPN_handler(metaclass=Singleton):
                                                    'OffRate',
                                                    str(off_rate)])
 
-    def generic_analysis(self, model_name, model_repo, parameter_list):
+    @staticmethod
+    def prepare_workspace(model_name, model_repo, workspace=None):
+        # empties the analysis folder and copies the model in it: the result is the path of the model, without extension
         try:
             # removing the directory
-            path = f'{os.getcwd()}/{model_repo}/{model_name}_analysis'
+            path = workspace if workspace is not None else f'{os.getcwd()}/{model_repo}/{model_name}_analysis'
             existing = os.path.isdir(path)
             if not existing:
                 os.makedirs(path, exist_ok=True)
@@ -114,9 +168,62 @@ class GSPN_handler(metaclass=Singleton):
         except Exception as e:
             print(e)
             raise
+        return model_name
+
+    def generic_analysis(self, model_name, model_repo, parameter_list, workspace=None):
+        model_name = GSPN_handler.prepare_workspace(model_name, model_repo, workspace)
         self.run_steady_state_analysis(model_name=model_name, parameters=parameter_list)
 
 
+class AsyncGSPNRunner:
+    """
+    Runs many GreatSPN steady state analyses at once in one process, at most concurrency of them at a time. The tools
+    of an analysis run one after the other as asyncio subprocesses, and its file operations run in-process. The output
+    of the tools goes to the {model}.log file of the analysis folder. A tool exiting with a non-zero code fails its
+    analysis with a GSPNException that quotes the end of the log.
+    """
+
+    def __init__(self, greatspn_scripts, concurrency=4):
+        self.greatspn_scripts = greatspn_scripts
+        self.concurrency = concurrency
+
+    async def run_operation(self, model_name, operation: Operation, log_file):
+        if operation.type == OpType.file:
+            run_file_operation(operation)
+            return
+        command = operation_command(self.greatspn_scripts, model_name, operation)
+        log_file.write(f"Executing: {' '.join(command)}\n")
+        log_file.flush()
+        with span(os.path.basename(command[0]), 'gspn') as args:
+            process = await asyncio.create_subprocess_exec(*command, stdout=log_file, stderr=asyncio.subprocess.STDOUT)
+            args['exit_code'] = await process.wait()
+        check_exit_code(command, args['exit_code'], model_name, log_file)
+
+    async def analysis(self, semaphore, job, number):
+        model_name, model_repo, parameter_list, workspace = job
+        async with semaphore:
+            # each analysis gets its own lane in the trace, as they overlap
+            lane(number)
+            with span('GSPN analysis', 'gspn', model=model_name):
+                model_name = GSPN_handler.prepare_workspace(model_name, model_repo, workspace)
+                with open(f'{model_name}.log', 'w') as log_file:
+                    for operation in GSPN_handler.steady_state_operations(model_name, parameter_list):
+                        await self.run_operation(model_name, operation, log_file)
+
+    async def run_jobs(self, jobs):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        return await asyncio.gather(*[self.analysis(semaphore, job, number + 1) for number, job in enumerate(jobs)],
+                                    return_exceptions=True)
+
+    def run(self, jobs):
+        """
+        :param jobs: (model name, model repository, -rpar parameter list, analysis folder) of each analysis; the
+        analyses must not share their folder.
+        :return: for each job, None if it succeeded, otherwise its exception.
+        """
+        return asyncio.run(self.run_jobs(jobs))
+
+
 if __name__ == '__main__':
     gspn_handler = GSPN_handler(greatspn_scripts='/Applications/GreatSPN/Contents/app/portable_greatspn/bin/')
     gspn_handler.one_sensor_analysis(detection_prob=np.float64(0.59),
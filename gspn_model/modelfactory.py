@@ -1,4 +1,12 @@
+import math
+import os
+import shutil
+import tempfile
+
 from gspn_model.engine import Engine
+from gspn_model.generator import ModelGenerator
+from gspn_model.gspn_naive_handle import AsyncGSPNRunner, GSPNException
+from gspn_model.native import NativeEngine
 
 
 # todo: move from static  method to instance methods
@@ -45,10 +53,10 @@ class PlainModelFactory:
             'UnDetectionProb_2': lambda conf: 1 - PlainModelFactory.indexed(conf, 'sensors', 1, 'detection_probability')
         },
         'three': {
-            'EvenStartRate': lambda conf: PlainModelFactory.simple(conf, 'process', 'activation_rate'),
+            'EventStartRate': lambda conf: PlainModelFactory.simple(conf, 'process', 'activation_rate'),
             'EventEndRate': lambda conf: PlainModelFactory.simple(conf, 'process', 'deactivation_rate'),
-            'InRate_1': lambda conf: PlainModelFactory.simple(conf, 'scheduler', 'on_rate'),
-            'OffRate_1': lambda conf: PlainModelFactory.simple(conf, 'scheduler', 'off_rate'),
+            'InRate': lambda conf: PlainModelFactory.simple(conf, 'scheduler', 'on_rate'),
+            'OffRate': lambda conf: PlainModelFactory.simple(conf, 'scheduler', 'off_rate'),
             'InRate_2': lambda conf: PlainModelFactory.simple(conf, 'scheduler', 'on_rate'),
             'OffRate_2': lambda conf: PlainModelFactory.simple(conf, 'scheduler', 'off_rate'),
             'InRate_3': lambda conf: PlainModelFactory.simple(conf, 'scheduler', 'on_rate'),
@@ -79,16 +87,23 @@ class PlainModelFactory:
         }
     }
 
+    # hand-drawn models; the other numbers of sensors and policies use a ModelGenerator model
     model_kb = {
         1: {
             'default': ('one_sensor', 'one', 'uno')
         },
         2: {
+            'independent': ('two_sensors', 'two', 'dos'),
             'interleaved': ('two_interleaved', 'two', 'dos'),
             'most_effective': ('two_most_probable', 'two', 'dos'),
             'default': ('two_sensors', 'two', 'dos')
         },
-        3: {'default': ('three_sensors', 'three', 'tres')}
+        3: {'independent': ('three_sensors', 'three', 'tres')}
+    }
+
+    engines = {
+        'greatspn': Engine,
+        'native': NativeEngine
     }
 
     @staticmethod
@@ -104,14 +119,34 @@ class PlainModelFactory:
         return len(list(params['sensors'].keys()))
 
     @staticmethod
-    def generate(gspn_parameters, repository_folder):
+    def get_policy(params):
+        # an unknown policy is taken as independent
+        policy = params['scheduler']['kind']
+        return policy if policy in ModelGenerator.policies else 'independent'
+
+    @staticmethod
+    def get_generator(gspn_parameters):
+        # None when a hand-drawn model is available
         numbers: int = PlainModelFactory.get_sensor_number(gspn_parameters)
-        default = PlainModelFactory.model_kb[numbers].get('default')
-        scheduling_policy = gspn_parameters['scheduler']['kind']
-        model_name, configuration_label, measures_label = PlainModelFactory.model_kb[numbers].get(scheduling_policy,
-                                                                                                  default)
-        configuration = PlainModelFactory.configurations[configuration_label]
-        measures = PlainModelFactory.measures[measures_label]
+        scheduling_policy = PlainModelFactory.get_policy(gspn_parameters)
+        known = PlainModelFactory.model_kb.get(numbers, dict())
+        if scheduling_policy in known or 'default' in known:
+            return None
+        return ModelGenerator(numbers, scheduling_policy)
+
+    @staticmethod
+    def instantiate(gspn_parameters):
+        generator = PlainModelFactory.get_generator(gspn_parameters)
+        if generator is not None:
+            model_name, configuration, measures = generator.model_name(), generator.bindings(), generator.measures()
+        else:
+            numbers: int = PlainModelFactory.get_sensor_number(gspn_parameters)
+            default = PlainModelFactory.model_kb[numbers].get('default')
+            scheduling_policy = PlainModelFactory.get_policy(gspn_parameters)
+            model_name, configuration_label, measures_label = PlainModelFactory.model_kb[numbers].get(
+                scheduling_policy, default)
+            configuration = PlainModelFactory.configurations[configuration_label]
+            measures = PlainModelFactory.measures[measures_label]
         configuration_copy = configuration.copy()
         for key in configuration.keys():
             func = configuration[key]
@@ -119,5 +154,80 @@ class PlainModelFactory:
             # configuration[key] = value       ERROR
             # In this way configuration is overwritten and it is not possible to have another iteration!!!
             configuration_copy[key] = value
-        engine = Engine(model_name, repository_folder, configuration_copy, measures, gspn_parameters)
+        return model_name, configuration_copy, measures
+
+    @staticmethod
+    def generate(gspn_parameters, repository_folder, engine_kind='greatspn', workspace=None, cache=None,
+                 greatspn=None):
+        generator = PlainModelFactory.get_generator(gspn_parameters)
+        if generator is not None:
+            generator.write(f'{os.getcwd()}/{repository_folder}')
+            print(f'Model {generator.model_name()}: {generator.projected_states()} tangible markings expected')
+        model_name, configuration, measures = PlainModelFactory.instantiate(gspn_parameters)
+        engine_class = PlainModelFactory.engines[engine_kind]
+        engine = engine_class(model_name, repository_folder, configuration, measures, gspn_parameters, workspace,
+                              cache, greatspn)
         return engine
+
+    @staticmethod
+    def sweep(gspn_parameters_list, repository_folder, engine_kind='greatspn', workspace=None, cache=None,
+              concurrency=1, greatspn=None):
+        # one engine for each model: the entries that share a model only change its rates and weights, so the
+        # engine can reuse its state space. The results keep the order of gspn_parameters_list; as in
+        # concurrent_sweep, a failed analysis is reported and its entry gets (math.inf, -math.inf)
+        if engine_kind == 'greatspn' and concurrency > 1 and len(gspn_parameters_list) > 1:
+            return PlainModelFactory.concurrent_sweep(gspn_parameters_list, repository_folder, workspace, cache,
+                                                      concurrency, greatspn)
+        engines = dict()
+        results = []
+        for gspn_parameters in gspn_parameters_list:
+            model_name, configuration, _ = PlainModelFactory.instantiate(gspn_parameters)
+            if model_name not in engines:
+                engines[model_name] = PlainModelFactory.generate(gspn_parameters, repository_folder, engine_kind,
+                                                                 workspace, cache, greatspn)
+            try:
+                results.extend(engines[model_name].sweep([configuration]))
+            except GSPNException as e:
+                PlainModelFactory.report_failure(model_name, e)
+                results.append((math.inf, -math.inf))
+        return results
+
+    @staticmethod
+    def report_failure(model_name, failure):
+        print(f'GSPN analysis of {model_name} failed: {failure}')
+
+    @staticmethod
+    def concurrent_sweep(gspn_parameters_list, repository_folder, workspace=None, cache=None, concurrency=4,
+                         greatspn=None):
+        # one GreatSPN engine and analysis folder for each entry, so the tool chains of concurrency entries overlap.
+        # Every successful analysis is stored before the results are read; a failed one is reported and its entry
+        # gets (math.inf, -math.inf), like an asset without measures
+        folder = tempfile.mkdtemp(prefix='ned_gspn_', dir=workspace)
+        try:
+            engines = []
+            for idx, gspn_parameters in enumerate(gspn_parameters_list):
+                model_name, configuration, measures = PlainModelFactory.instantiate(gspn_parameters)
+                if model_name not in [engine.model for engine in engines]:
+                    engine = PlainModelFactory.generate(gspn_parameters, repository_folder, 'greatspn',
+                                                        f'{folder}/{idx}', cache, greatspn)
+                else:
+                    engine = Engine(model_name, repository_folder, configuration, measures, gspn_parameters,
+                                    f'{folder}/{idx}', cache, greatspn)
+                engines.append(engine)
+            pending = [engine for engine in engines if not engine.cached()]
+            failed = set()
+            if len(pending) > 0:
+                runner = AsyncGSPNRunner(pending[0].gspn_bin_path, concurrency)
+                for engine, failure in zip(pending, runner.run([engine.job() for engine in pending])):
+                    if failure is None:
+                        try:
+                            engine.store()
+                        except GSPNException as e:
+                            failure = e
+                    if failure is not None:
+                        PlainModelFactory.report_failure(engine.model, failure)
+                        failed.add(id(engine))
+            return [(engine.safety(), engine.sustainability()) if id(engine) not in failed else (math.inf, -math.inf)
+                    for engine in engines]
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
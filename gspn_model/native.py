@@ -0,0 +1,306 @@
+import os
+from collections import deque
+
+import numpy as np
+
+from gspn_model.engine import Engine
+from utils.tracing import span, count
+
+
+class NativeEngineException(Exception):
+    def __init__(self, message):
+        # Call the base class constructor with the parameters it needs
+        super().__init__(message)
+        self.message = message
+
+
+class Transition:
+    def __init__(self, name, rate, servers, kind):
+        self.name = name
+        # a negative rate is the (1-based) index of a rate parameter
+        self.rate = rate
+        self.servers = servers
+        # 0 is exponential, otherwise the transition is immediate and kind is the index of its priority group
+        self.kind = kind
+        self.inputs = []
+        self.outputs = []
+        self.inhibitors = []
+
+    def is_immediate(self):
+        return self.kind != 0
+
+
+class PetriNet:
+    """
+    GSPN read from a GreatSPN .net file. Only the features used by the models in the repository are supported:
+    exponential and immediate transitions, priority groups, rate parameters and inhibitor arcs.
+    """
+
+    def __init__(self, filename):
+        self.places = []
+        self.initial_marking = []
+        self.rate_parameters = []
+        self.priorities = []
+        self.transitions = []
+        self.parse(filename)
+
+    @staticmethod
+    def __arcs(lines, position, number):
+        arcs = []
+        for _ in range(number):
+            elements = lines[position].split()
+            multiplicity, place, points = int(elements[0]), int(elements[1]), int(elements[2])
+            arcs.append((place - 1, multiplicity))
+            # skipping the coordinates of the intermediate points
+            position += 1 + points
+        return arcs, position
+
+    def parse(self, filename):
+        with open(filename, 'r') as net_file:
+            lines = [line for line in net_file.read().splitlines() if line.strip() != '']
+        position = 0
+        while not lines[position].startswith('f '):
+            position += 1
+        _, marking_num, place_num, rate_num, trans_num, group_num = lines[position].split()[:6]
+        position += 1
+        marking_parameters = []
+        for _ in range(int(marking_num)):
+            elements = lines[position].split()
+            marking_parameters.append(int(elements[1]))
+            position += 1
+        for _ in range(int(place_num)):
+            elements = lines[position].split()
+            marking = int(elements[1])
+            if marking < 0:
+                marking = marking_parameters[-marking - 1]
+            # the superposition tags follow the name after a |
+            self.places.append(elements[0].split('|')[0])
+            self.initial_marking.append(marking)
+            position += 1
+        for _ in range(int(rate_num)):
+            elements = lines[position].split()
+            self.rate_parameters.append((elements[0], float(elements[1])))
+            position += 1
+        for _ in range(int(group_num)):
+            elements = lines[position].split()
+            self.priorities.append(int(elements[3]))
+            position += 1
+        for _ in range(int(trans_num)):
+            elements = lines[position].split()
+            transition = Transition(elements[0].split('|')[0], float(elements[1]), int(elements[2]), int(elements[3]))
+            # the number of input arcs is on the transition line, the other numbers precede their arcs
+            transition.inputs, position = PetriNet.__arcs(lines, position + 1, int(elements[4]))
+            transition.outputs, position = PetriNet.__arcs(lines, position + 1, int(lines[position].split()[0]))
+            transition.inhibitors, position = PetriNet.__arcs(lines, position + 1, int(lines[position].split()[0]))
+            self.transitions.append(transition)
+
+    def priority(self, transition: Transition):
+        return self.priorities[transition.kind - 1] if transition.is_immediate() else 0
+
+    def enabling_degree(self, transition: Transition, marking):
+        for place, multiplicity in transition.inhibitors:
+            if marking[place] >= multiplicity:
+                return 0
+        degree = None
+        for place, multiplicity in transition.inputs:
+            place_degree = marking[place] // multiplicity
+            degree = place_degree if degree is None else min(degree, place_degree)
+        # a transition without input places is always enabled once
+        return 1 if degree is None else degree
+
+    def fire(self, transition: Transition, marking):
+        new_marking = list(marking)
+        for place, multiplicity in transition.inputs:
+            new_marking[place] -= multiplicity
+        for place, multiplicity in transition.outputs:
+            new_marking[place] += multiplicity
+        return tuple(new_marking)
+
+    def resolve(self, parameters):
+        # value (rate or weight) of each transition, given the -rpar-like parameters
+        values = []
+        for transition in self.transitions:
+            value = transition.rate
+            if value < 0:
+                name, default = self.rate_parameters[int(-value) - 1]
+                value = float(parameters.get(name, default))
+                if value < 0:
+                    raise NativeEngineException(f'Parameter {name} of transition {transition.name} is not set')
+            values.append(value)
+        return np.array(values)
+
+
+class ReachabilityGraph:
+    """
+    Tangible and vanishing markings of a PetriNet. The graph keeps the transition indices instead of the rates, so
+    the same structure can be solved for any assignment of the rate parameters.
+    """
+
+    def __init__(self, net: PetriNet, max_states=1000000):
+        self.net = net
+        self.tangible = []
+        self.vanishing = []
+        # (source, transition, enabling factor, target is tangible, target)
+        self.timed_arcs = []
+        # (source, transition, target is tangible, target)
+        self.immediate_arcs = []
+        self.explore(max_states)
+
+    def explore(self, max_states):
+        net = self.net
+        index = dict()
+        queue = deque()
+
+        def visit(marking):
+            if marking not in index:
+                if len(index) >= max_states:
+                    raise NativeEngineException(f'More than {max_states} markings')
+                immediate = [t for t in net.transitions if t.is_immediate() and net.enabling_degree(t, marking) > 0]
+                if len(immediate) > 0:
+                    index[marking] = (False, len(self.vanishing))
+                    self.vanishing.append(marking)
+                else:
+                    index[marking] = (True, len(self.tangible))
+                    self.tangible.append(marking)
+                queue.append(marking)
+            return index[marking]
+
+        visit(tuple(net.initial_marking))
+        while len(queue) > 0:
+            marking = queue.popleft()
+            is_tangible, source = index[marking]
+            if is_tangible:
+                for t_idx, transition in enumerate(net.transitions):
+                    degree = net.enabling_degree(transition, marking)
+                    if degree > 0:
+                        # servers equal to 0 means infinite server semantics
+                        factor = degree if transition.servers == 0 else min(degree, transition.servers)
+                        target_tangible, target = visit(net.fire(transition, marking))
+                        self.timed_arcs.append((source, t_idx, factor, target_tangible, target))
+            else:
+                enabled = [(t_idx, transition) for t_idx, transition in enumerate(net.transitions)
+                           if transition.is_immediate() and net.enabling_degree(transition, marking) > 0]
+                top = max(net.priority(transition) for _, transition in enabled)
+                for t_idx, transition in enabled:
+                    if net.priority(transition) == top:
+                        target_tangible, target = visit(net.fire(transition, marking))
+                        self.immediate_arcs.append((source, t_idx, target_tangible, target))
+
+    def size(self):
+        return len(self.tangible), len(self.vanishing)
+
+    def solve(self, values):
+        """
+        Steady state of the GSPN for the given transition values.
+
+        The unknowns are the probabilities of the tangible markings and the rates at which the vanishing markings are
+        crossed, so the vanishing markings are eliminated inside one sparse linear system.
+
+        :param values: rate (timed transitions) or weight (immediate transitions) of each transition.
+        :return: the tangible probabilities and the throughput of every transition.
+        """
+        # SciPy is imported here: the module is loaded with every engine, the solver only runs with this one
+        from scipy.sparse import coo_matrix, csc_matrix
+        from scipy.sparse.linalg import spsolve
+        n_t, n_v = self.size()
+        if n_t == 0:
+            raise NativeEngineException('The net has no tangible markings')
+        size = n_t + n_v
+        rows, cols, data = [], [], []
+        outflow = np.zeros(n_t)
+        timed_rates = []
+        for source, t_idx, factor, target_tangible, target in self.timed_arcs:
+            rate = factor * values[t_idx]
+            timed_rates.append(rate)
+            outflow[source] += rate
+            rows.append(source)
+            cols.append(target if target_tangible else n_t + target)
+            data.append(rate)
+        weights = np.zeros(n_v)
+        for source, t_idx, _, _ in self.immediate_arcs:
+            weights[source] += values[t_idx]
+        immediate_probabilities = []
+        for source, t_idx, target_tangible, target in self.immediate_arcs:
+            probability = values[t_idx] / weights[source]
+            immediate_probabilities.append(probability)
+            rows.append(n_t + source)
+            cols.append(target if target_tangible else n_t + target)
+            data.append(probability)
+        # diagonal: outgoing rate for the tangible markings, 1 for the vanishing ones
+        rows.extend(range(size))
+        cols.extend(range(size))
+        data.extend(-outflow)
+        data.extend([-1.0] * n_v)
+        # z A = 0 is solved as A^T z = 0, with the first balance equation replaced by the normalisation
+        matrix = coo_matrix((data, (cols, rows)), shape=(size, size)).tolil()
+        matrix[0, :] = 0
+        matrix[0, :n_t] = 1
+        rhs = np.zeros(size)
+        rhs[0] = 1
+        solution = spsolve(csc_matrix(matrix), rhs)
+        probabilities = solution[:n_t]
+        crossings = solution[n_t:]
+        throughputs = np.zeros(len(self.net.transitions))
+        for (source, t_idx, _, _, _), rate in zip(self.timed_arcs, timed_rates):
+            throughputs[t_idx] += probabilities[source] * rate
+        for (source, t_idx, _, _), probability in zip(self.immediate_arcs, immediate_probabilities):
+            throughputs[t_idx] += crossings[source] * probability
+        return probabilities, throughputs
+
+    def mean_tokens(self, probabilities):
+        return probabilities @ np.array(self.tangible, dtype=float)
+
+
+class NativeEngine(Engine):
+    """
+    In-process alternative to the GreatSPN tool chain: the same .net file is solved with SciPy and the measures are
+    served from memory. The reachability graph only depends on the structure of the net, so it is built once for each
+    model file and reused by every engine and every sweep on that model.
+    """
+
+    graphs = dict()
+
+    def __init__(self, model, model_repo, configuration, measures, gspn_parameters=None, workspace=None, cache=None,
+                 greatspn=None):
+        # nothing is written on disk and GreatSPN is not run, so the workspace and greatspn are not used
+        self.model = model
+        self.model_configuration = configuration
+        self.model_repo = model_repo
+        self.measures = measures
+        self.gspn_parameters = gspn_parameters
+        self.cache = cache
+        self.cache_key = None
+        self.measure_values = None
+        self.net, self.graph = NativeEngine.load(f'{os.getcwd()}/{model_repo}/{model}.net')
+        self.throughputs = None
+        self.tokens = None
+
+    @staticmethod
+    def load(filename):
+        key = (filename, os.path.getmtime(filename))
+        if key not in NativeEngine.graphs:
+            with span('NativeEngine.load', 'gspn', net=os.path.basename(filename)) as args:
+                net = PetriNet(filename)
+                graph = ReachabilityGraph(net)
+                args['tangible'], args['vanishing'] = graph.size()
+            count('tangible_states', args['tangible'])
+            count('vanishing_states', args['vanishing'])
+            NativeEngine.graphs[key] = (net, graph)
+        return NativeEngine.graphs[key]
+
+    def run(self):
+        values = self.net.resolve(self.model_configuration)
+        probabilities, throughputs = self.graph.solve(values)
+        self.throughputs = dict(zip([t.name for t in self.net.transitions], throughputs))
+        self.tokens = dict(zip(self.net.places, self.graph.mean_tokens(probabilities)))
+
+    def get_throughput(self, transition_name: str) -> float:
+        if transition_name not in self.throughputs:
+            print(f'Error {transition_name}')
+            raise NativeEngineException('Thru not found')
+        return float(self.throughputs[transition_name])
+
+    def get_mean_tokens(self, node_name) -> float:
+        if node_name not in self.tokens:
+            raise NativeEngineException('Node not found')
+        return float(self.tokens[node_name])
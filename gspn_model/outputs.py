@@ -0,0 +1,64 @@
+import re
+
+import numpy as np
+
+
+class AnalysisOutputs:
+    """
+    Measures written by the GreatSPN steady state analysis, read once:
+    - the place indices from the .grg file;
+    - the Thru_ lines of the .sta file;
+    - the token distributions of the .tpd file, which is memory-mapped and decoded with NumPy.
+    """
+
+    def __init__(self, netpath, model):
+        self.basename = f'{netpath}/{model}'
+        self.place_ids = dict()
+        self.place_num = 0
+        self.throughputs = dict()
+        self.tokens = None
+        self.read_grg()
+        self.read_sta()
+
+    def read_grg(self):
+        with open(f'{self.basename}.grg', 'r') as grg_file:
+            # number of subnets, places, groups and transitions
+            self.place_num = int(grg_file.readline().split()[1])
+            for line in grg_file:
+                elements = line.split(maxsplit=1)
+                if len(elements) == 2 and elements[0].isdigit():
+                    for name in re.findall(r'[A-Za-z_]\w*', elements[1]):
+                        self.place_ids.setdefault(name, int(elements[0]))
+
+    def read_sta(self):
+        with open(f'{self.basename}.sta', 'r') as sta_file:
+            for line in sta_file:
+                if line.startswith('Thru_'):
+                    elements = line.split()
+                    self.throughputs[elements[0][len('Thru_'):]] = float(elements[2])
+
+    def read_tpd(self):
+        # for each place: the minimum and the maximum number of tokens, then the probability of each number of tokens
+        tokens = np.zeros(self.place_num + 1)
+        data = np.memmap(f'{self.basename}.tpd', dtype=np.float64, mode='r')
+        offset = 0
+        for place_id in range(1, self.place_num + 1):
+            min_tokens, max_tokens = data[offset], data[offset + 1]
+            count = int(max_tokens - min_tokens) + 1
+            probabilities = data[offset + 2:offset + 2 + count]
+            tokens[place_id] = probabilities @ (min_tokens + np.arange(count))
+            offset += 2 + count
+        self.tokens = tokens
+
+    def throughput(self, transition_name):
+        if transition_name not in self.throughputs:
+            print(f'Error {transition_name}')
+            raise Exception('Thru not found')
+        return self.throughputs[transition_name]
+
+    def mean_tokens(self, node_name):
+        if node_name not in self.place_ids:
+            raise Exception("Node not found")
+        if self.tokens is None:
+            self.read_tpd()
+        return float(self.tokens[self.place_ids[node_name]])
@@ -1,17 +1,28 @@
+import copy
+import functools
 import glob
 import math
+import multiprocessing
+import shutil
 import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 
-from bayes.bayesian import Network
+import numpy as np
+
+from bayes.bayesian import NetworkRegistry
+from domain.estimators import SequentialStatistics
 from domain.factory import ProcessFactoryRegistry
 from domain.geometry import Geometry
+from domain.placement import PlacementSearch
 from domain.process import NoMoreDataException
-from domain.results import Results, ActivationRateException
+from domain.results import Results, ActivationRateException, InsufficientSamplesException, render
 from domain.sensors import Sensor
-from domain.utils import transport_formula, Asset
-from gspn_model.engine import Engine
+from domain.utils import transport_formula, Asset, Place, attenuation
+from gspn_model.cache import AnalysisCache
 from gspn_model.modelfactory import PlainModelFactory
 from utils.configuration import Configuration
+from utils.tracing import span, count, Tracer, traced_call
 from utils.utils import check_first_line
 
 
@@ -30,38 +41,159 @@ def run_simulation(geometry: Geometry, num_steps):
         process.append(v)
         for s in geometry.sensors:
             name = s.getName()
-            data = transport_formula(v, s.probabilistic_characterization, geometry.process.place, s.place)
+            data = transport_formula(v, s.probabilistic_characterization, geometry.process.place, s.place,
+                                     geometry.rng)
             measures[name].append(data)
         for idx, place in enumerate(aoi_places):
             aois[idx].append(transport_formula(v, None, geometry.process.place, place))
-    # Threshold
+    thresholds = get_thresholds(geometry)
+    results = Results(process, measures, aois, thresholds)
+    return results
+
+
+def get_thresholds(geometry: Geometry):
     thresholds = dict()
     for s in geometry.sensors:
         thresholds[s.getName()] = s.getThreshold()
-    thresholds['asset'] = aoi_places[0].getThreshold()  # todo: extends in case of multiple asset
-    results = Results(process, measures, aois, thresholds)
+    thresholds['assets'] = [asset.getThreshold() for asset in geometry.aoi]
+    return thresholds
+
+
+def generate_process_series(process, num_steps):
+    series = process.generate_batch(num_steps)
+    if len(series) < num_steps:
+        print('No more data')
+    return series
+
+
+def run_vectorized_simulation(geometry: Geometry, num_steps):
+    # same model as run_simulation, but each stage is computed on the whole series at once:
+    # the sensor noise is drawn as a single (steps x sensors) matrix
+    process = generate_process_series(geometry.process, num_steps)
+    sensors = geometry.sensors
+    mus = np.array([s.probabilistic_characterization.mu for s in sensors], dtype=float)
+    sigmas = np.array([s.probabilistic_characterization.sigma for s in sensors], dtype=float)
+    data = np.empty((len(process), len(sensors) + len(geometry.aoi)))
+    sensor_matrix = data[:, :len(sensors)]
+    np.multiply.outer(process, attenuation(geometry.process.place, [s.place for s in sensors]), out=sensor_matrix)
+    sensor_matrix += geometry.rng.normal(mus, sigmas, size=sensor_matrix.shape)
+    np.multiply.outer(process, attenuation(geometry.process.place, geometry.aoi), out=data[:, len(sensors):])
+    thresholds = get_thresholds(geometry)
+    results = Results.from_matrix(process, [s.getName() for s in sensors], data, thresholds)
+    return results
+
+
+def run_adaptive_simulation(geometry: Geometry, num_steps, precision=0.05, max_steps=None, confidence=0.95):
+    # simulates chunks of num_steps until the detection probabilities and the mean run lengths of every asset reach
+    # the relative precision, or max_steps are simulated
+    max_steps = max_steps if max_steps is not None else 10 * num_steps
+    sensor_number = len(geometry.sensors)
+    statistics = [SequentialStatistics(sensor_number) for _ in geometry.aoi]
+    chunks = []
+    used = 0
+    reason = 'maximum number of steps'
+    while used < max_steps:
+        requested = min(num_steps, max_steps - used)
+        chunk = run_vectorized_simulation(geometry, requested)
+        if chunk.number_of_samples() > 0:
+            chunks.append(chunk)
+            used += chunk.number_of_samples()
+            detection = chunk.get_detection_matrix()
+            for idx, asset_statistics in enumerate(statistics):
+                asset_statistics.update(detection[:, :sensor_number], detection[:, sensor_number + idx])
+        if all(asset_statistics.converged(precision, confidence) for asset_statistics in statistics):
+            reason = 'precision reached'
+            break
+        if chunk.number_of_samples() < requested:
+            reason = 'no more data'
+            break
+    print(f'Adaptive simulation stopped after {used} steps: {reason}')
+    if len(chunks) == 0:
+        return run_vectorized_simulation(geometry, 0)
+    return Results.concatenate(chunks)
+
+
+simulation_modes = {
+    'plain': run_simulation,
+    'vectorized': run_vectorized_simulation,
+    'adaptive': run_adaptive_simulation
+}
+
+
+def get_simulation(config):
+    mode = config.get('simulation_mode')
+    simulation = simulation_modes[mode]
+    if mode == 'adaptive':
+        simulation = functools.partial(simulation, precision=config.get('precision'),
+                                       max_steps=config.get('max_steps'), confidence=config.get('confidence'))
+    return simulation
+
+
+def enough_samples(results: Results, min_asset_samples, idx=None):
+    # the Bayesian stage needs the asset over its threshold, the rates need a complete run on each side of it.
+    # With idx equal to None all the assets are checked
+    runs, _ = results.get_run_counts()
+    samples = results.get_asset_detection_matrix().sum(axis=0)
+    enough = (samples >= min_asset_samples) & (runs[False] > 0) & (runs[True] > 0)
+    return bool(enough.all()) if idx is None else bool(enough[idx])
+
+
+def extend_simulation(simulation, geometry: Geometry, results: Results, num_steps, min_asset_samples=1,
+                      max_extensions=10):
+    # the process and the random generator of the geometry keep their state, so each new simulation goes on from the
+    # last simulated step and is appended to results
+    extensions = 0
+    while not enough_samples(results, min_asset_samples):
+        more = None
+        if extensions < max_extensions:
+            more = simulation(geometry=geometry, num_steps=num_steps)
+        if more is None or more.number_of_samples() == 0:
+            reason = f'{max_extensions} extensions' if more is None else 'no more data'
+            samples = results.get_asset_detection_matrix().sum(axis=0).tolist()
+            raise InsufficientSamplesException(f'Not enough asset samples after {results.number_of_samples()} steps '
+                                               f'({reason}): {samples} over the threshold, '
+                                               f'{min_asset_samples} and a complete run on each side are needed')
+        results.append(more)
+        extensions += 1
     return results
 
 
-def build(configuration):
+def build(configuration, rng=None):
     # Process setting
     process_info = configuration.get('process')
     process_kind = process_info['kind']
     process_factory = ProcessFactoryRegistry.getFactory(process_kind)
-    process = process_factory.generate(process_info)
-    # Asset setting
-    asset_threshold = configuration.get('hazardlevel')
-    asset_x, asset_y = configuration.get('asset')
-    asset = Asset(asset_x, asset_y, asset_threshold)
+    process = process_factory.generate(process_info, rng)
+    # Assets setting
+    assets = [Asset(x, y, threshold)
+              for (x, y), threshold in zip(configuration.get('assets'), configuration.get('hazardlevels'))]
     # Sensors setting
     sensors = configuration.get('sensors')
     sensors = list(map(lambda x: Sensor(x, configuration.get(x)), sensors))
     # geometry
     # @TODO: refactor Geometry's last parameter in AssetsOfInterest
-    geometry = Geometry(process, sensors, [asset])
+    geometry = Geometry(process, sensors, assets, rng)
     return geometry
 
 
+def simulate(config, geometry: Geometry):
+    number_of_steps = config.get('simulation_steps')
+    simulation = get_simulation(config)
+    with span('simulation', mode=config.get('simulation_mode'), steps=number_of_steps):
+        results = simulation(geometry=geometry, num_steps=number_of_steps)
+    try:
+        # instead of starting again from step zero, the series is extended until the Bayesian stage can run
+        with span('extend_simulation'):
+            extend_simulation(simulation, geometry, results, number_of_steps, config.get('min_asset_samples'),
+                              config.get('max_extensions'))
+    except InsufficientSamplesException as e:
+        print(e.message)
+    count('samples', results.number_of_samples())
+    for idx in range(len(geometry.aoi)):
+        count(f'asset_{idx}_samples', results.get_asset_samples(idx))
+    return results
+
+
 def make_global_parameters(analysis, activation_rate, deactivation_rate, config):
     retval = {'process':
                   {'activation_rate': activation_rate,
@@ -76,46 +208,277 @@ def make_global_parameters(analysis, activation_rate, deactivation_rate, config)
 
 
 def draw(config, geometry: Geometry, results: Results):
+    # with plot_background the decimated series are rendered by another process, which is returned
     out_folder = config.get('outfolder')
     geometry.draw(out_folder)
-    results.draw(out_folder)
+    figures = results.figures(config.get('plot_points'))
+    if not config.get('plot_background'):
+        render(figures, out_folder, config.get('plot_rasterized'))
+        return None
+    renderer = multiprocessing.Process(target=render, args=(figures, out_folder, config.get('plot_rasterized')))
+    renderer.start()
+    return renderer
+
+
+def get_cache(config, use_cache=True):
+    folder = config.get('gspn_cache')
+    if not use_cache or folder is None:
+        return None
+    return AnalysisCache.open(folder, config.get('gspn_cache_size'))
 
 
-def core(configuration_filename, draw_flag, ext_configuration=None):
-    safety_measure = math.inf
-    sustainability_measure = -math.inf
+def make_asset_parameters(config, results: Results):
+    # Bayesian stage and process rates of each asset, from one detection matrix: the GSPN parameters of each asset,
+    # or None when it cannot be analysed
+    with span('process_rates'):
+        activation_rates, deactivation_rates = results.get_activation_deactivation_rates()
+    with span('detection_tables'):
+        tables = results.get_detection_tables()
+    parameters = []
+    for idx, table in enumerate(tables):
+        try:
+            if not enough_samples(results, config.get('min_asset_samples'), idx):
+                raise InsufficientSamplesException(f'Not enough samples of asset {idx}')
+            with span('bayes', asset=idx, backend=config.get('bayes_backend')):
+                network = NetworkRegistry.getNetwork(config.get('bayes_backend'))(results.get_sensor_names())
+                network.build(table)
+                analysis = network.analysis()
+            if not analysis:
+                raise InsufficientSamplesException('The Bayesian network has no sensors to analyse')
+        except InsufficientSamplesException as e:
+            print(e.message)
+            parameters.append(None)
+            continue
+        parameters.append(make_global_parameters(analysis, float(activation_rates[idx]),
+                                                 float(deactivation_rates[idx]), config))
+    return parameters
+
+
+def evaluate_assets(config, asset_parameters, scheduler_grid=None, workspace=None, use_cache=True):
+    # one GSPN sweep over the assets (and the scheduler_grid entries): the result has a list of (safety,
+    # sustainability) couples, one for each asset, for each scheduler_grid entry
+    grid = scheduler_grid if scheduler_grid is not None else [dict()]
+    parameters_list = list()
+    for rates in grid:
+        for global_parameters in asset_parameters:
+            if global_parameters is not None:
+                global_parameters = copy.deepcopy(global_parameters)
+                global_parameters['scheduler'].update(rates)
+                parameters_list.append(global_parameters)
+    with span('gspn', engine=config.get('gspn_engine'), analyses=len(parameters_list)):
+        measures = PlainModelFactory.sweep(parameters_list, config.get('greatspn_repos'), config.get('gspn_engine'),
+                                           workspace, get_cache(config, use_cache), config.get('gspn_concurrency'),
+                                           config.get('greatspn'))
+    measures = iter(measures)
+    results = [[next(measures) if global_parameters is not None else (math.inf, -math.inf)
+                for global_parameters in asset_parameters] for _ in grid]
+    return results if scheduler_grid is not None else results[0]
+
+
+def worst_case(measures):
+    # the highest MToT and the lowest ISL among the assets
+    return max(mtot for mtot, _ in measures), min(isl for _, isl in measures)
+
+
+def report(measures):
+    mtot, isl = worst_case(measures)
+    retval = {'MToT': mtot, 'ISL': isl}
+    if len(measures) > 1:
+        retval['assets'] = [{'MToT': asset_mtot, 'ISL': asset_isl} for asset_mtot, asset_isl in measures]
+    return retval
+
+
+def core_assets(configuration_filename, draw_flag, ext_configuration=None, workspace=None, use_cache=True,
+                rng=None):
+    # MToT and ISL of each asset: the process and the sensors are simulated once for all of them
     if ext_configuration is None:
         config = Configuration(configuration_filename)
     else:
         config = ext_configuration
-    geometry = build(config)
-    number_of_steps = config.get('simulation_steps')
-    error = True
-    while error:
-        results = run_simulation(geometry=geometry, num_steps=number_of_steps)
-        table = results.get_detection_table()
-        network = Network(results.get_sensor_names())
-        network.build(table)
-        analysis = network.analysis()
-        error = not bool(analysis)
-        if not error:
-            try:
-                activation_rate, deactivation_rate = results.get_process_activation_deactivation_rates()
-            except ActivationRateException as e:
-                print(e.message)
-                if draw_flag:
-                    draw(config, geometry, results)
-                return safety_measure, sustainability_measure
-            # error = activation_rate == 0 or deactivation_rate == 0
-            global_parameters = make_global_parameters(analysis, activation_rate, deactivation_rate, config)
-            gspn_repo = config.get('greatspn_repos')
-            engine: Engine = PlainModelFactory.generate(global_parameters, gspn_repo)
-            engine.execute()
-            safety_measure = engine.safety()  # mean* global_parameters['numero'];
-            sustainability_measure = engine.sustainability()
-    if draw_flag:
-        draw(config, geometry, results)
-    return safety_measure, sustainability_measure
+    with span('core', configuration=configuration_filename):
+        with span('build'):
+            geometry = build(config, rng)
+        results = simulate(config, geometry)
+        renderer = None
+        if draw_flag:
+            with span('draw'):
+                renderer = draw(config, geometry, results)
+        asset_parameters = make_asset_parameters(config, results)
+        measures = evaluate_assets(config, asset_parameters, None, workspace, use_cache)
+        if renderer is not None:
+            with span('draw_wait'):
+                renderer.join()
+    return measures
+
+
+def core(configuration_filename, draw_flag, ext_configuration=None, workspace=None, use_cache=True, rng=None):
+    # worst case among the assets
+    return worst_case(core_assets(configuration_filename, draw_flag, ext_configuration, workspace, use_cache, rng))
+
+
+def core_sweep(configuration_filename, scheduler_grid, ext_configuration=None, workspace=None, use_cache=True):
+    # the simulation and the Bayesian stage do not depend on the scheduler: they run once, then the GSPN analysis is
+    # repeated for each {'on_rate': ..., 'off_rate': ...} entry of scheduler_grid. Each entry gets the worst case
+    # among the assets
+    if ext_configuration is None:
+        config = Configuration(configuration_filename)
+    else:
+        config = ext_configuration
+    with span('core_sweep', configuration=configuration_filename, grid=len(scheduler_grid)):
+        with span('build'):
+            geometry = build(config)
+        results = simulate(config, geometry)
+        asset_parameters = make_asset_parameters(config, results)
+        measures = evaluate_assets(config, asset_parameters, scheduler_grid, workspace, use_cache)
+    return [worst_case(asset_measures) for asset_measures in measures]
+
+
+def run_job(configuration_filename, draw_flag, use_cache=True):
+    # a job owns its configuration and a scratch folder for the GSPN analysis, so jobs can run side by side
+    config = Configuration(configuration_filename)
+    workspace = tempfile.mkdtemp(prefix='ned_')
+    try:
+        return core_assets(configuration_filename, draw_flag, config, workspace, use_cache)
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+
+def pool_map(executor, function, *arguments):
+    # with an active tracer every worker records its own spans, which are merged in the tracer of this process
+    if Tracer.active is None:
+        return list(executor.map(function, *arguments))
+    outcomes = []
+    for result, records in executor.map(functools.partial(traced_call, function), *arguments):
+        Tracer.active.merge(records)
+        outcomes.append(result)
+    return outcomes
+
+
+def run_batch(configuration_names, draw_flag, workers=None, use_cache=True):
+    # workers equal to None uses all the cores; the results keep the order of configuration_names
+    results = dict()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        outcomes = pool_map(executor, run_job, configuration_names, [draw_flag] * len(configuration_names),
+                            [use_cache] * len(configuration_names))
+        for filename, measures in zip(configuration_names, outcomes):
+            results[filename] = report(measures)
+    return results
+
+
+def run_replication(configuration_filename, seed_sequence, use_cache=True):
+    # the replication draws all its random numbers from its own generator, so it only depends on seed_sequence
+    config = Configuration(configuration_filename)
+    workspace = tempfile.mkdtemp(prefix='ned_')
+    try:
+        return core(configuration_filename, False, config, workspace, use_cache, np.random.default_rng(seed_sequence))
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+
+def summarize(values, confidence):
+    # mean and confidence interval (Student's t) of the finite values; the others are failed replications
+    from scipy.stats import t
+    values = np.asarray(values, dtype=float)
+    finite = values[np.isfinite(values)]
+    summary = {'mean': math.nan, 'ci': (math.nan, math.nan), 'replications': len(finite),
+               'failures': len(values) - len(finite)}
+    if len(finite) > 0:
+        mean = float(finite.mean())
+        half_width = 0.0
+        if len(finite) > 1:
+            half_width = float(t.ppf((1 + confidence) / 2, len(finite) - 1) * finite.std(ddof=1) /
+                               math.sqrt(len(finite)))
+        summary['mean'] = mean
+        summary['ci'] = (mean - half_width, mean + half_width)
+    return summary
+
+
+def replicate(configuration_filename, replications, seed=None, workers=1, confidence=0.95, use_cache=True):
+    # each replication gets a child of the master SeedSequence: the results are the same whatever the workers
+    master = np.random.SeedSequence(seed)
+    children = master.spawn(replications)
+    arguments = ([configuration_filename] * replications, children, [use_cache] * replications)
+    if workers == 1:
+        outcomes = list(map(run_replication, *arguments))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            outcomes = pool_map(executor, run_replication, *arguments)
+    return {'MToT': summarize([mtot for mtot, _ in outcomes], confidence),
+            'ISL': summarize([isl for _, isl in outcomes], confidence),
+            'seed': master.entropy}
+
+
+placement_objectives = {
+    'mtot': lambda mtot, isl, weight: mtot,
+    'isl': lambda mtot, isl, weight: -isl,
+    'mix': lambda mtot, isl, weight: weight * mtot - (1 - weight) * isl
+}
+
+
+def optimize_placement(configuration_filename, ext_configuration=None, workspace=None, use_cache=True, rng=None):
+    # the layouts are searched on one simulated series and ranked by their detection score on the worst asset; the
+    # GSPN analysis only runs on the shortlist, which is returned from the best to the worst layout for the objective
+    # of its worst case among the assets (lower is better)
+    if ext_configuration is None:
+        config = Configuration(configuration_filename)
+    else:
+        config = ext_configuration
+    placement = config.get('placement')
+    geometry = build(config, rng)
+    process = generate_process_series(geometry.process, config.get('simulation_steps'))
+    assets = geometry.aoi
+    asset_series = np.multiply.outer(process, attenuation(geometry.process.place, assets))
+    results = Results.from_matrix(process, [], asset_series, {'assets': [asset.getThreshold() for asset in assets]})
+    rates = []
+    try:
+        for idx in range(len(assets)):
+            if results.get_asset_samples(idx) == 0:
+                raise InsufficientSamplesException(f'Asset {idx + 1} is never over its threshold')
+            rates.append(results.get_process_activation_deactivation_rates(idx))
+    except (InsufficientSamplesException, ActivationRateException) as e:
+        print(e.message)
+        return []
+    # the configured sensors give thresholds and noise to the placed ones, in turn
+    templates = config.get('sensors')
+    sensors = []
+    for k in range(placement['sensors']):
+        template = templates[k % len(templates)]
+        name = template if k < len(templates) else f'{template}_{k // len(templates) + 1}'
+        sensors.append(Sensor(name, config.get(template)))
+    process_place = geometry.process.place
+    candidates = [Place(x, y) for x, y in placement['candidates'] if (x, y) != (process_place.x, process_place.y)]
+    asset_detection = np.column_stack([results.get_asset_detection(idx) for idx in range(len(assets))])
+    search = PlacementSearch(process, process_place, candidates, sensors, asset_detection, geometry.rng)
+    with span('placement_search', search=placement['search'], candidates=len(candidates)):
+        if placement['search'] == 'greedy':
+            search.greedy()
+        else:
+            search.local_search()
+    objective = placement_objectives[placement['objective']]
+    shortlist = search.shortlist(placement['shortlist'])
+    # one analysis for each layout and asset
+    parameters_list = [make_global_parameters(search.analysis(layout, idx), *rates[idx], config)
+                       for layout in shortlist for idx in range(len(assets))]
+    with span('gspn', engine=config.get('gspn_engine'), analyses=len(parameters_list)):
+        measures = PlainModelFactory.sweep(parameters_list, config.get('greatspn_repos'), config.get('gspn_engine'),
+                                           workspace, get_cache(config, use_cache), config.get('gspn_concurrency'),
+                                           config.get('greatspn'))
+    measures = iter(measures)
+    evaluated = []
+    for layout in shortlist:
+        # the worst case among the assets and, with more than one asset, the measures of each of them
+        entry = {'positions': search.positions(layout), 'score': search.scores[layout]}
+        entry.update(report([next(measures) for _ in assets]))
+        entry['objective'] = objective(entry['MToT'], entry['ISL'], placement['weight'])
+        evaluated.append(entry)
+    evaluated.sort(key=lambda entry: entry['objective'])
+    return evaluated
+
+
+def get_option(name, default=None):
+    if sys.argv.__contains__(name):
+        return sys.argv[sys.argv.index(name) + 1]
+    return default
 
 
 if __name__ == '__main__':
@@ -124,12 +487,36 @@ if __name__ == '__main__':
         configuration_names = list()
         drawing_flag = sys.argv.__contains__('--draw')
         dir_flag = sys.argv.__contains__('--dir')
+        jobs = int(get_option('--jobs', 1))
+        cache_flag = not sys.argv.__contains__('--no-cache')
         if not dir_flag:
             configuration_names = [sys.argv[1]]
         else:
             configuration_names = glob.glob(sys.argv[1] + "/*.ini")
             configuration_names = list(filter(check_first_line, configuration_names))
-        for filename in configuration_names:
-            mtot, isl = core(filename, drawing_flag)
-            results[filename] = {'MToT': mtot, 'ISL': isl}
+        replications = int(get_option('--replications', 0))
+        trace_file = get_option('--trace')
+        if trace_file is not None:
+            Tracer.start()
+        if sys.argv.__contains__('--optimize'):
+            for filename in configuration_names:
+                results[filename] = optimize_placement(filename, use_cache=cache_flag)
+        elif replications > 0:
+            seed = get_option('--seed')
+            seed = int(seed) if seed is not None else None
+            confidence = float(get_option('--confidence', 0.95))
+            for filename in configuration_names:
+                results[filename] = replicate(filename, replications, seed, jobs if jobs > 0 else None, confidence,
+                                              cache_flag)
+        elif jobs != 1:
+            results = run_batch(configuration_names, drawing_flag, jobs if jobs > 0 else None, cache_flag)
+        else:
+            for filename in configuration_names:
+                results[filename] = report(core_assets(filename, drawing_flag, use_cache=cache_flag))
+            for folder, cache in AnalysisCache.opened.items():
+                print(f'GSPN cache {folder}: {cache.stats()}')
         print(results)
+        if trace_file is not None:
+            tracer = Tracer.stop()
+            tracer.write(trace_file)
+            print(tracer.table())
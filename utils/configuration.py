@@ -1,18 +1,33 @@
 import configparser
-import io
 import os
 from configparser import ConfigParser
 
-from utils.metaclasses import Singleton
-from utils.utils import tostring
+import numpy as np
 
+from utils.utils import tostring, tobool
+
+
+class Configuration:
+    """
+    Settings of one scenario: each instance is independent, so a process can hold many of them. The main file is read
+    once; the included files are parsed once for each modification time and shared by all the instances, so a batch of
+    scenarios including the same sensor, process and scheduler files reads each of them once. A key set in the main
+    file overrides the one of an included file.
+    """
+
+    # (path, modification time) of an included file -> its sections
+    fragments = dict()
 
-class Configuration(metaclass=Singleton):
     process_registry = {
         'spike': [('range', float), ('rate', float), ('mu', float), ('sigma', float), ('level', float)],
         'walk': [('drift', float), ('mu', float), ('sigma', float), ('level', float)],
         'file': [('filename', str), ('filepath', str)]
     }
+    # optional keys of the process sections, with their default values
+    process_options = {
+        'file': [('column', str, 'Coincidenze analizzate'), ('chunk_size', int, 65536), ('sidecar', tobool, 'true'),
+                 ('sidecar_folder', str, None)]
+    }
 
     def __init__(self, inifilename=None):
         self.board = dict()
@@ -20,11 +35,7 @@ class Configuration(metaclass=Singleton):
             self.init_from_filename(inifilename)
 
     def init_from_filename(self, inifilename):
-        content = self.preprocess(inifilename)
-        reader = ConfigParser()
-        inifile = io.StringIO(content)
-        reader.read_file(inifile)
-        self.load(reader)
+        self.load(self.preprocess(inifilename))
 
     def init_from_content(self, content):
         self.load(content)
@@ -60,17 +71,56 @@ class Configuration(metaclass=Singleton):
             self.put('greatspn', temp)
             temp = reader['main']['greatspn_project']
             self.put('greatspn_repos', temp)
+            temp = reader['main'].get('gspn_engine', 'greatspn')
+            self.put('gspn_engine', temp)
+            temp = reader['main'].get('gspn_cache', None)
+            self.put('gspn_cache', temp)
+            temp = int(reader['main'].get('gspn_cache_size', 1000))
+            self.put('gspn_cache_size', temp)
+            temp = int(reader['main'].get('gspn_concurrency', 1))
+            self.put('gspn_concurrency', temp)
             temp = reader['main']['outfolder']
             self.put('outfolder', temp)
+            # --draw: points of each plotted series (0 draws every sample), rasterized lines, background rendering
+            temp = int(reader['main'].get('plot_points', 4000))
+            self.put('plot_points', temp)
+            temp = tobool(reader['main'].get('plot_rasterized', False))
+            self.put('plot_rasterized', temp)
+            temp = tobool(reader['main'].get('plot_background', False))
+            self.put('plot_background', temp)
             temp = int(reader['main']['simulation_steps'])
             self.put('simulation_steps', temp)
-            temp = float(reader['main']['hazardlevel'])
-            self.put('hazardlevel', temp)
+            temp = reader['main'].get('simulation_mode', 'plain')
+            self.put('simulation_mode', temp)
+            temp = float(reader['main'].get('precision', 0.05))
+            self.put('precision', temp)
+            temp = reader['main'].get('max_steps', None)
+            self.put('max_steps', int(temp) if temp is not None else None)
+            temp = float(reader['main'].get('confidence', 0.95))
+            self.put('confidence', temp)
+            temp = int(reader['main'].get('min_asset_samples', 1))
+            self.put('min_asset_samples', temp)
+            temp = int(reader['main'].get('max_extensions', 10))
+            self.put('max_extensions', temp)
+            temp = reader['main'].get('bayes_backend', 'counting')
+            self.put('bayes_backend', temp)
+            # several assets are separated by ;, with one hazard level each or one for all of them
             temp = reader['main']['asset']
             if type(temp) is str:
-                temp = temp.split(',')
-                temp = tuple([float(i) for i in temp])
-            self.put('asset', temp)
+                temp = [tuple([float(i) for i in couple.split(',')]) for couple in temp.split(';')]
+            elif type(temp) is tuple:
+                temp = [temp]
+            self.put('assets', temp)
+            self.put('asset', temp[0])
+            temp = reader['main']['hazardlevel']
+            if type(temp) is str:
+                temp = [float(i) for i in temp.split(';')]
+            elif not isinstance(temp, list):
+                temp = [float(temp)]
+            if len(temp) == 1:
+                temp = temp * len(self.get('assets'))
+            self.put('hazardlevels', temp)
+            self.put('hazardlevel', temp[0])
             temp = reader['main']['sensors']
             if type(temp) is str:
                 sensors = list(temp.split(','))
@@ -102,6 +152,9 @@ class Configuration(metaclass=Singleton):
                 process_key, process_function = element
                 value = reader[process][process_key]
                 dictionary[process_key] = process_function(value)
+            for process_key, process_function, default in Configuration.process_options.get(process, []):
+                value = reader[process].get(process_key, default)
+                dictionary[process_key] = process_function(value) if value is not None else None
             self.put('process', dictionary)
             # Scheduler configuration
             temp = reader['main']['scheduling']
@@ -110,13 +163,47 @@ class Configuration(metaclass=Singleton):
             self.put('on_rate', temp)
             temp = float(reader['scheduler']['off_rate'])
             self.put('off_rate', temp)
+            # Sensor placement search (optional)
+            if 'placement' in reader:
+                self.put('placement', self.load_placement(reader['placement'], len(sensors)))
         except Exception as s:
             print(s)
+        # checked out of the try, so that the mismatch stops the run instead of being printed
+        if 'hazardlevels' in self.board and len(self.get('hazardlevels')) != len(self.get('assets')):
+            raise ValueError(f"asset and hazardlevel differ in length: {len(self.get('assets'))} assets but "
+                             f"{len(self.get('hazardlevels'))} hazard levels")
+
+    @staticmethod
+    def load_placement(section, sensor_number):
+        # candidates are listed as x,y;x,y;... and/or given as a square grid xmin,xmax,step
+        candidates = []
+        if section.get('candidates', None) is not None:
+            for couple in section['candidates'].split(';'):
+                candidates.append(tuple([float(i) for i in couple.split(',')]))
+        if section.get('grid', None) is not None:
+            low, high, step = [float(i) for i in section['grid'].split(',')]
+            values = np.arange(low, high + step / 2, step)
+            candidates.extend((float(x), float(y)) for x in values for y in values)
+        placement = {'candidates': list(dict.fromkeys(candidates)),
+                     'sensors': int(section.get('sensors', sensor_number)),
+                     'objective': section.get('objective', 'mtot'),
+                     'weight': float(section.get('weight', 0.5)),
+                     'search': section.get('search', 'local'),
+                     'shortlist': int(section.get('shortlist', 3))}
+        return placement
+
+    @staticmethod
+    def fragment(filename):
+        key = (os.path.abspath(filename), os.stat(filename).st_mtime_ns)
+        if key not in Configuration.fragments:
+            parser = ConfigParser(interpolation=None)
+            parser.read_string(tostring(filename), filename)
+            Configuration.fragments[key] = {section: dict(parser[section]) for section in parser.sections()}
+        return Configuration.fragments[key]
 
     def preprocess(self, inifile):
-        content = tostring(inifile)
         reader = ConfigParser()
-        reader.read(inifile)
+        reader.read_string(tostring(inifile), inifile)
 
         includes = reader['main']['include'].split(',')
         # imposto infolder per i file .ini
@@ -125,6 +212,11 @@ class Configuration(metaclass=Singleton):
         else:
             infolder = os.getcwd()
         for include in includes:
-            content += '\n' + tostring(f'{infolder}{include}')
+            for section, options in Configuration.fragment(f'{infolder}{include}').items():
+                if not reader.has_section(section):
+                    reader.add_section(section)
+                for key, value in options.items():
+                    if not reader.has_option(section, key):
+                        reader.set(section, key, value)
 
-        return content
+        return reader
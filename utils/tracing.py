@@ -0,0 +1,165 @@
+import contextvars
+import json
+import os
+import threading
+import time
+
+
+class Span:
+    """
+    Timed region of a Tracer. Entering it gives the dictionary of its arguments, which the traced code can fill (an
+    exit code, a cache hit); the time spent in the nested spans is subtracted from its self time.
+    """
+
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+        self.lane = Tracer.lane.get()
+        self.start = None
+        self.children = 0
+        self.token = None
+
+    def __enter__(self):
+        self.token = Tracer.current.set(self)
+        self.start = time.perf_counter_ns()
+        return self.args
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration = time.perf_counter_ns() - self.start
+        Tracer.current.reset(self.token)
+        parent = Tracer.current.get()
+        if parent is not None and parent.tracer is self.tracer and parent.lane == self.lane:
+            parent.children += duration
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        self.tracer.record(self, duration)
+        return False
+
+
+class Disabled:
+    # stands for a Span when no tracer is recording
+    def __init__(self, args):
+        self.args = args
+
+    def __enter__(self):
+        return self.args
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+class Tracer:
+    """
+    Opt-in instrumentation: nested spans (with their wall time and arguments) and counters, recorded in the process
+    that started the tracer. The timestamps are wall clock microseconds, so the events of the worker processes can be
+    merged in one trace. The records are exported in the Chrome trace event format (chrome://tracing, Perfetto) and
+    summarised in a table with the calls, the total, mean, maximum and self time and the failures of each span.
+    When no tracer is recording, span() and count() do nothing.
+    """
+
+    active = None
+    current = contextvars.ContextVar('span', default=None)
+    # thread id of the spans in the trace, when the concurrent tasks of one thread get one row each
+    lane = contextvars.ContextVar('lane', default=None)
+
+    def __init__(self):
+        # the wall clock time of perf_counter zero
+        self.origin = time.time_ns() - time.perf_counter_ns()
+        self.events = []
+        self.counters = dict()
+
+    @staticmethod
+    def start():
+        Tracer.active = Tracer()
+        return Tracer.active
+
+    @staticmethod
+    def stop():
+        tracer, Tracer.active = Tracer.active, None
+        return tracer
+
+    def record(self, span: Span, duration):
+        args = dict(span.args, self_us=(duration - span.children) / 1000)
+        self.events.append({'name': span.name, 'cat': span.category, 'ph': 'X',
+                            'ts': (self.origin + span.start) / 1000, 'dur': duration / 1000, 'pid': os.getpid(),
+                            'tid': span.lane if span.lane is not None else threading.get_ident(), 'args': args})
+
+    def count(self, name, value):
+        self.counters[name] = self.counters.get(name, 0) + value
+        self.events.append({'name': name, 'ph': 'C', 'ts': time.time_ns() / 1000, 'pid': os.getpid(),
+                            'args': {name: self.counters[name]}})
+
+    def export(self):
+        return {'events': self.events, 'counters': self.counters}
+
+    def merge(self, exported):
+        # records of a worker process
+        self.events.extend(exported['events'])
+        for name, value in exported['counters'].items():
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def chrome_trace(self):
+        return {'traceEvents': self.events, 'displayTimeUnit': 'ms', 'otherData': {'counters': self.counters}}
+
+    def write(self, filename):
+        with open(filename, 'w') as trace_file:
+            json.dump(self.chrome_trace(), trace_file)
+
+    def summary(self):
+        # name -> calls, total, self and maximum seconds, failures (an exception or a non-zero exit code)
+        retval = dict()
+        for event in self.events:
+            if event['ph'] != 'X':
+                continue
+            entry = retval.setdefault(event['name'], {'calls': 0, 'total': 0.0, 'self': 0.0, 'max': 0.0,
+                                                      'failures': 0})
+            seconds = event['dur'] / 1e6
+            entry['calls'] += 1
+            entry['total'] += seconds
+            entry['self'] += event['args']['self_us'] / 1e6
+            entry['max'] = max(entry['max'], seconds)
+            if 'error' in event['args'] or event['args'].get('exit_code', 0) != 0:
+                entry['failures'] += 1
+        return retval
+
+    def table(self):
+        rows = sorted(self.summary().items(), key=lambda item: item[1]['total'], reverse=True)
+        width = max([len('span')] + [len(name) for name, _ in rows])
+        lines = [f'{"span":<{width}} {"calls":>7} {"total s":>10} {"mean ms":>10} {"max ms":>10} {"self s":>10} '
+                 f'{"failures":>8}']
+        for name, entry in rows:
+            lines.append(f'{name:<{width}} {entry["calls"]:>7} {entry["total"]:>10.3f} '
+                         f'{1000 * entry["total"] / entry["calls"]:>10.3f} {1000 * entry["max"]:>10.3f} '
+                         f'{entry["self"]:>10.3f} {entry["failures"]:>8}')
+        for name, value in sorted(self.counters.items()):
+            lines.append(f'{name}: {value}')
+        return '\n'.join(lines)
+
+
+def span(name, category='ned', **args):
+    # with span('name', key=value) as args: ... records the block in the active tracer, if any
+    if Tracer.active is None:
+        return Disabled(args)
+    return Span(Tracer.active, name, category, args)
+
+
+def lane(number):
+    # the spans opened afterwards, in the current thread or asyncio task, are drawn in row number of the trace
+    Tracer.lane.set(number)
+
+
+def count(name, value=1):
+    if Tracer.active is not None:
+        Tracer.active.count(name, value)
+
+
+def traced_call(function, *args):
+    # runs function with a tracer of its own (in a worker process): the result comes back with the records
+    Tracer.start()
+    try:
+        result = function(*args)
+    finally:
+        tracer = Tracer.stop()
+    return result, tracer.export()
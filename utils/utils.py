@@ -1,6 +1,8 @@
+import contextlib
 import os
 import string
 import random
+import tempfile
 
 def tostring(filename):
     with open(filename, 'r') as file:
@@ -8,6 +10,10 @@ def tostring(filename):
         file_content = ''.join(lines)
     return file_content
 
+def tobool(value):
+    return str(value).strip().lower() in ['true', 'yes', 'on', '1']
+
+
 def tolist(value):
     retval = value.split(',')
     return retval
@@ -39,5 +45,24 @@ def clear_folder(dir):
             except Exception as e:
                 print(e)
 
+@contextlib.contextmanager
+def atomic_write(path, mode='w'):
+    # with atomic_write(path) as file: ... writes the file aside and renames it, so concurrent processes never read a
+    # partial file. mkstemp creates it readable by its owner only: it gets the usual 0644 mode, so other accounts
+    # sharing the folder can read it
+    descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, mode) as file:
+            yield file
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, path)
+    except BaseException:
+        try:
+            os.remove(temporary)
+        except OSError:
+            pass
+        raise
+
+
 def id_generator(size=10, chars=string.ascii_lowercase + string.digits):
     return ''.join(random.choice(chars) for _ in range(size))
\ No newline at end of file